@@ -0,0 +1,77 @@
+"""
+Compare compositing Imgen templates with Pillow against the vectorized NumPy compositor.
+
+Run from the repository root with ``python -m benchmarks.imgen_compositing``,
+NumPy must be installed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import timeit
+
+from PIL import Image
+
+from benchmarks.imgen_templates import make_avatar
+from cogs.utils.imgen.assets import AssetRegistry
+from cogs.utils.imgen.compositing import VectorizedPlan
+from cogs.utils.imgen.render import MAX_BATCH, place_avatar, render_many
+from cogs.utils.imgen.templates import AVATAR, TEMPLATES, compile_template
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=40, help="avatars per template")
+    args = parser.parse_args()
+
+    avatar = make_avatar().getvalue()
+    assets = AssetRegistry.load()
+    print(
+        f"{'template':<12}{'pillow':>10}{'numpy':>10}{f'numpy x{MAX_BATCH}':>12}"
+        f"{'renders/s':>20}{'identical':>11}"
+    )
+    for name, template in TEMPLATES.items():
+        plan = compile_template(template)
+        vectorized = VectorizedPlan(plan, assets, MAX_BATCH)
+        placed = place_avatar(avatar, plan)
+        batch = [placed] * MAX_BATCH
+
+        def pillow() -> Image.Image:
+            image = Image.new("RGBA", plan.size, None)
+            for layer in plan.layers:
+                if layer == AVATAR:
+                    image.paste(placed, plan.box[:2], placed)
+                else:
+                    image.paste(assets[layer], (0, 0), assets[layer])
+            return image
+
+        def numpy() -> None:
+            vectorized.composite(batch[:1])
+
+        def batched() -> None:
+            vectorized.composite(batch)
+
+        def timed(function, number: int) -> float:
+            return min(timeit.repeat(function, number=number, repeat=3)) / number
+
+        # Per avatar, compositing only
+        before = timed(pillow, args.number)
+        after = timed(numpy, args.number)
+        after_batched = timed(batched, -(-args.number // MAX_BATCH)) / MAX_BATCH
+        # Whole renders, decoding and encoding included
+        avatars = [avatar] * args.number
+        throughput = [
+            args.number / timed(lambda: render_many(name, avatars, "fast", compositor), 1)
+            for compositor in ("pillow", "numpy")
+        ]
+        identical = render_many(name, [avatar], "fast", "pillow") == render_many(
+            name, [avatar], "fast", "numpy"
+        )
+        print(
+            f"{name:<12}{before * 1000:>8.2f}ms{after * 1000:>8.2f}ms{after_batched * 1000:>10.2f}ms"
+            f"{throughput[0]:>9.1f} -> {throughput[1]:<7.1f}{identical!s:>11}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Compare the Imgen encoding profiles, encode time against output size, on every template.
+
+Run from the repository root with ``python -m benchmarks.imgen_encoding``.
+"""
+
+from __future__ import annotations
+
+import argparse
+import timeit
+from io import BytesIO
+
+from PIL import Image
+
+from benchmarks.imgen_templates import make_avatar
+from cogs.utils.imgen.encoding import PROFILES
+from cogs.utils.imgen.render import render
+from cogs.utils.imgen.templates import TEMPLATES
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=5, help="encodes per profile")
+    args = parser.parse_args()
+
+    avatar = make_avatar().getvalue()
+    print(f"{'template':<12}{'profile':<12}{'encode':>12}{'size':>12}")
+    for template in TEMPLATES:
+        # Lossless, so this is exactly the canvas every profile is given
+        with Image.open(BytesIO(render(template, avatar, "fast"))) as image:
+            image.load()
+            for name, (format, _, options) in PROFILES.items():
+                fp = BytesIO()
+
+                def encode() -> None:
+                    fp.seek(0)
+                    fp.truncate()
+                    image.save(fp, format, **options)
+
+                elapsed = min(timeit.repeat(encode, number=args.number, repeat=3)) / args.number
+                size = len(fp.getvalue())
+                print(f"{template:<12}{name:<12}{elapsed * 1000:>10.2f}ms{size / 1024:>8.1f} KiB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare Imgen renders reading their template layers from disk against the asset registry.
+
+Run from the repository root with ``python -m benchmarks.imgen_templates``.
+
+Both go through the real `render` and `render_many`, with the Pillow compositor since
+the NumPy one keeps its own copy of the layers.
+"""
+
+from __future__ import annotations
+
+import argparse
+import importlib
+import timeit
+from io import BytesIO
+from typing import Iterator, Mapping
+
+from PIL import Image
+
+from cogs.utils.imgen.assets import ASSETS_PATH, AssetRegistry
+from cogs.utils.imgen.templates import TEMPLATES
+
+# The package exports a render function under the module's name
+renderer = importlib.import_module("cogs.utils.imgen.render")
+
+
+def make_avatar(size: int = 512) -> BytesIO:
+    fp = BytesIO()
+    Image.radial_gradient("L").resize((size, size)).convert("RGBA").save(fp, "PNG")
+    return fp
+
+
+def make_textured_avatar(size: int = 512) -> BytesIO:
+    """Noise in every channel, where a smooth gradient would hide resampling differences."""
+    fp = BytesIO()
+    channels = [Image.effect_noise((size, size), 64) for _ in range(3)]
+    Image.merge("RGB", channels).convert("RGBA").save(fp, "PNG")
+    return fp
+
+
+class DiskAssets(Mapping[str, Image.Image]):
+    """The layers opened and converted on every use, as renders did before the registry."""
+
+    def __getitem__(self, name: str) -> Image.Image:
+        with Image.open(ASSETS_PATH / f"{name}.png") as image:
+            return image.convert("RGBA")
+
+    def __iter__(self) -> Iterator[str]:
+        return (path.stem for path in ASSETS_PATH.glob("*.png"))
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=5, help="calls per timing")
+    parser.add_argument("-r", "--repeat", type=int, default=7, help="timings per call")
+    parser.add_argument("-b", "--batch", type=int, default=8, help="avatars per render_many")
+    args = parser.parse_args()
+
+    avatar = make_avatar().getvalue()
+    renderer.init_worker()
+    sources = {"disk": DiskAssets(), "registry": AssetRegistry.load()}
+    print(f"{'template':<12}{'call':<14}{'disk':>12}{'registry':>12}{'saved':>8}")
+    for name in TEMPLATES:
+        calls = {
+            "render": lambda: renderer.render(name, avatar),
+            "render_many": lambda: renderer.render_many(name, [avatar] * args.batch),
+        }
+        for call, run in calls.items():
+            renders = args.batch if call == "render_many" else 1
+            # Alternated, so a noisy stretch doesn't land on one of them only
+            times = dict.fromkeys(sources, float("inf"))
+            for _ in range(args.repeat):
+                for source, assets in sources.items():
+                    renderer._assets = assets
+                    elapsed = timeit.timeit(run, number=args.number) / args.number / renders
+                    times[source] = min(times[source], elapsed)
+            before, after = times["disk"], times["registry"]
+            print(
+                f"{name:<12}{call:<14}{before * 1000:>10.2f}ms{after * 1000:>10.2f}ms"
+                f"{1 - after / before:>8.0%}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Compare placing the avatar with a resize, a rotation and a paste against the fused placement.
+
+Run from the repository root with ``python -m benchmarks.imgen_transform``.
+
+Both are also compared to a reference rendered at 4 times the size and downscaled,
+the smooth avatar hides resampling differences so a noisy one is measured too.
+"""
+
+from __future__ import annotations
+
+import argparse
+import timeit
+from io import BytesIO
+
+from PIL import Image, ImageChops, ImageStat
+
+from benchmarks.imgen_templates import make_avatar, make_textured_avatar
+from cogs.utils.imgen.render import place_avatar
+from cogs.utils.imgen.templates import TEMPLATES, Template, compile_template
+
+SUPERSAMPLING = 4
+
+
+def place_separately(
+    data: bytes,
+    template: Template,
+    scale: int = 1,
+    rotation: Image.Resampling = Image.Resampling.NEAREST,
+) -> Image.Image:
+    """How the avatar used to be placed, two resampling passes and an intermediate image."""
+    with Image.open(BytesIO(data)) as image:
+        size = template.avatar_size * scale
+        avatar = image.convert("RGBA").resize((size, size), Image.Resampling.LANCZOS)
+    if template.rotation:
+        avatar = avatar.rotate(template.rotation, rotation, expand=1)
+    canvas = Image.new("RGBA", (template.size[0] * scale, template.size[1] * scale), None)
+    canvas.paste(avatar, (template.offset[0] * scale, template.offset[1] * scale), avatar)
+    return canvas
+
+
+def reference(data: bytes, template: Template) -> Image.Image:
+    canvas = place_separately(data, template, SUPERSAMPLING, Image.Resampling.BICUBIC)
+    return canvas.resize(template.size, Image.Resampling.LANCZOS)
+
+
+def difference(first: Image.Image, second: Image.Image) -> tuple[float, int]:
+    """The mean and the largest difference of two images' channels, out of 255."""
+    stat = ImageStat.Stat(ImageChops.difference(first, second))
+    return sum(stat.mean) / len(stat.mean), max(high for _, high in stat.extrema)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("-n", "--number", type=int, default=50, help="placements per template")
+    args = parser.parse_args()
+
+    avatars = {"smooth": make_avatar().getvalue(), "noisy": make_textured_avatar().getvalue()}
+    print(
+        f"{'template':<12}{'avatar':<8}{'separate':>12}{'fused':>12}{'saved':>8}"
+        f"{'difference':>16}{'old error':>12}{'new error':>12}"
+    )
+    for name, template in TEMPLATES.items():
+        plan = compile_template(template)
+        for kind, avatar in avatars.items():
+
+            def separate() -> Image.Image:
+                return place_separately(avatar, template)
+
+            def fused() -> Image.Image:
+                canvas = Image.new("RGBA", template.size, None)
+                placed = place_avatar(avatar, plan)
+                canvas.paste(placed, plan.box[:2], placed)
+                return canvas
+
+            before = min(timeit.repeat(separate, number=args.number, repeat=3)) / args.number
+            after = min(timeit.repeat(fused, number=args.number, repeat=3)) / args.number
+            old, new, ideal = separate(), fused(), reference(avatar, template)
+            mean, largest = difference(old, new)
+            print(
+                f"{name:<12}{kind:<8}{before * 1000:>10.2f}ms{after * 1000:>10.2f}ms"
+                f"{1 - after / before:>8.0%}{mean:>10.2f} / {largest:<3}"
+                f"{difference(old, ideal)[0]:>12.2f}{difference(new, ideal)[0]:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,86 @@
-import json
-import random
+import asyncio
+import functools
+import hashlib
+import time
+from collections import OrderedDict
 from datetime import datetime
-from typing import Literal, Optional
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, Hashable, Literal, Optional, Sequence
 
 import aiohttp
 import discord
+from discord.ext import tasks
+from redis.exceptions import RedisError
 
+from cogs.utils.fumo import (
+    CONTENT_FLAGS,
+    CatalogBuilder,
+    CatalogDelta,
+    CatalogSnapshot,
+    ContentType,
+    Favourites,
+    FumoCatalog,
+    FumoPool,
+    LinkChecker,
+    LinkStatus,
+    MirrorSelector,
+    ShuffleBagSampler,
+    ThumbnailCache,
+    build_batch_payloads,
+    compose_grid,
+)
 from core import commands
 from core.bot import FumoBot
 
+CHUNK_SIZE = 64 * 1024
+FILTERS_KEY = "fumo:filters"
+# Past this many deltas, the snapshot is rewritten as a whole
+MAX_SNAPSHOT_DELTAS = 32
+THUMBNAILS_PATH = Path(__file__).parent.parent / "cache" / "thumbnails"
+# How many (channel, user) pairs to remember the last Fumos of, for favouriting
+MAX_LAST_RECEIVED = 10_000
+# Checks in a row a link has to fail to be left out, unless it's gone (404, 410)
+MAX_LINK_FAILURES = 4
+# A check can't leave out more than this share of the catalog, that's an outage, not dead links
+MAX_DEAD_SHARE = 0.5
+# The most failing links shown by the catalog check command
+MAX_SHOWN_LINKS = 10
+
+
+def delta_url(url: str, version: int) -> str:
+    """Returns the URL of the delta from ``version`` to the latest version of a catalog."""
+    return f"{url.rpartition('/')[0]}/deltas/{version}.json"
+
 
 class Fumo(commands.Cog):
     """Get random Fumos."""
 
     def __init__(self, bot: FumoBot):
-        self.fumos: dict[str, list[str]] = {}
+        self.catalog: FumoCatalog = FumoCatalog.empty()
+        self.snapshot: Optional[CatalogSnapshot] = None
+        # Lives on the cog, so the bags survive catalog refreshes
+        self.sampler = ShuffleBagSampler()
+        self.last_refresh: Optional[datetime] = None
+        self.last_refresh_duration: Optional[float] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self.mirrors = MirrorSelector()
+        self.link_checker: Optional[LinkChecker] = None
+        # URL -> how many checks in a row it failed, only failing URLs are kept
+        self.link_failures: dict[str, int] = {}
+        # URL -> its last status, for the failing and suspicious URLs of the last check
+        self.link_statuses: dict[str, LinkStatus] = {}
+        self.links_checked = 0
+        self.last_link_check: Optional[datetime] = None
+        # Guild ID -> mask of disabled content types
+        self.guild_filters: dict[int, int] = {}
+        self.favourites: Optional[Favourites] = None
+        # Held while favourites are renumbered, so they're never read or set against
+        # a catalog they aren't numbered for
+        self.favourites_lock = asyncio.Lock()
+        self.thumbnails: Optional[ThumbnailCache] = None
+        # (Channel ID, user ID) -> catalog indices of the Fumos they last got there
+        self.last_received: OrderedDict[tuple[int, int], list[int]] = OrderedDict()
         self.is_friday = lambda: datetime.today().weekday() == 4
         super().__init__(bot)
 
@@ -22,36 +88,390 @@ class Fumo(commands.Cog):
     def display_emoji(self) -> discord.PartialEmoji:
         return discord.PartialEmoji(name="Cirno", id=935836292653146123)
 
-    async def fetch_fumos(self) -> None:
-        async with self.bot.session.get("https://kuro-rui.github.io/api/fumo/all.json") as resp:
+    async def _fetch_from(
+        self, url: str, headers: dict[str, str], responded: Callable[[], None]
+    ) -> Optional[tuple[CatalogBuilder, Optional[str], Optional[str]]]:
+        """Fetch and parse the catalog from one mirror, returns `None` if it's not modified."""
+        builder = CatalogBuilder()
+        parser = builder.parser()
+        async with self.bot.session.get(url, headers=headers) as resp:
+            responded()
+            if resp.status == 304:
+                return None
+            resp.raise_for_status()
+            # Parsed as it arrives, so the document is never held in memory as a whole
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                parser.feed(chunk)
+            parser.close()
+            return builder, resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+    async def _fetch_delta(
+        self, url: str, version: int, responded: Callable[[], None]
+    ) -> Optional[tuple[CatalogDelta, bytes]]:
+        """Fetch the delta since ``version`` from one mirror, returns `None` if there's none."""
+        async with self.bot.session.get(delta_url(url, version)) as resp:
+            responded()
+            if resp.status == 404:
+                return None
+            resp.raise_for_status()
+            data = await resp.read()
+        return CatalogDelta.from_bytes(data), data
+
+    async def fetch_delta(self) -> bool:
+        """
+        Patch the catalog with the changes since its version.
+
+        Returns `False` if there's no usable delta and the whole catalog should be fetched.
+        """
+        catalog = self.catalog
+        if catalog.version is None or not self.snapshot:
+            return False
+        # Dead slots are only reclaimed by a full build
+        if catalog.dead_entries * 4 > len(catalog):
+            return False
+        try:
+            result = await self.mirrors.fetch(
+                self.bot.config.fumo_mirrors,
+                lambda url, responded: self._fetch_delta(url, catalog.version, responded),
+            )
+            if result is None:
+                return False
+            delta, data = result
+            if delta.version == catalog.version:
+                self._log.debug("Fumo catalog is up to date.")
+                return True
+            # Weighted pools the delta touches rebuild their alias tables, off the loop
+            patched = await self.bot.loop.run_in_executor(None, catalog.patch, delta)
+            self.catalog = await self.exclude_dead_links(patched)
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc_info:
+            self._log.warning("Failed to apply the Fumo catalog delta", exc_info=exc_info)
+            return False
+        if len(self.snapshot.deltas) < MAX_SNAPSHOT_DELTAS:
+            self.snapshot = await self.snapshot.append(self.bot.redis, data)
+        else:
+            data = await self.bot.loop.run_in_executor(None, self.catalog.to_bytes)
+            # Patches don't renumber the entries, the favourites stay in their epoch
+            self.snapshot = CatalogSnapshot(data, epoch=self.snapshot.epoch)
+            await self.snapshot.save(self.bot.redis)
+        self._log.info(
+            "Patched the Fumo catalog to version %d with %d changes.", delta.version, len(delta)
+        )
+        return True
+
+    async def fetch_fumos(self) -> bool:
+        """
+        Fetch the catalog, revalidating the current snapshot if there's one.
+
+        A versioned catalog is patched with a delta when one is available,
+        otherwise it's fetched as a whole.
+        Mirrors are tried fastest first, hedging to the next one if a mirror is slow.
+        Returns `True` if the catalog is up to date afterwards, `False` otherwise.
+        Use :meth:`refresh` instead so concurrent callers share one fetch.
+        """
+        if not self.bot.config.fumo_mirrors:
+            self._log.warning("No Fumo mirrors are configured, can't fetch Fumos.")
+            return False
+        try:
+            return await self._fetch_fumos()
+        except RedisError as exc_info:
+            self._log.exception("Failed to save the Fumo catalog", exc_info=exc_info)
+            return False
+
+    async def _fetch_fumos(self) -> bool:
+        if await self.fetch_delta():
+            return True
+        headers = self.snapshot.headers if self.snapshot else {}
+        try:
+            result = await self.mirrors.fetch(
+                self.bot.config.fumo_mirrors,
+                lambda url, responded: self._fetch_from(url, headers, responded),
+            )
+        except (aiohttp.ClientError, asyncio.TimeoutError) as exc_info:
+            self._log.exception("Failed to fetch Fumos", exc_info=exc_info)
+            return False
+        except ValueError as exc_info:
+            self._log.exception("Failed to parse Fumos", exc_info=exc_info)
+            return False
+        if result is None:
+            self._log.debug("Fumo catalog is up to date.")
+            return True
+        builder, etag, last_modified = result
+        try:
+            # Big catalogs take a while to build and to dump, both happen off the loop
+            build = functools.partial(builder.build, excluded=self.dead_links)
+            catalog = await self.bot.loop.run_in_executor(None, build)
+        except ValueError as exc_info:
+            self._log.exception("Failed to build the Fumo catalog", exc_info=exc_info)
+            return False
+        data = await self.bot.loop.run_in_executor(None, catalog.to_bytes)
+        old, old_epoch = self.catalog, self.favourites.epoch
+        async with self.favourites_lock:
+            # Renumbered before the new catalog is served
+            epoch = await self.remap_favourites(old, catalog, data)
+            snapshot = CatalogSnapshot(data, etag, last_modified, epoch=epoch)
+            # Switches epochs, until then the old catalog and favourites are kept
+            await snapshot.save(self.bot.redis)
+            self.catalog = await self.exclude_dead_links(catalog)
+            self.snapshot = snapshot
+            self.favourites.epoch = epoch
+        self._log.info("Successfully fetched %d Fumos.", len(self.catalog))
+        # Only once copied, favourites that couldn't be renumbered are kept
+        if old and epoch != old_epoch:
             try:
-                resp.raise_for_status()
-            except aiohttp.ClientResponseError as exc_info:
-                self._log.exception("Failed to fetch Fumos", exc_info=exc_info)
-            self.fumos = json.loads(await resp.text())
-        self._log.info("Successfully fetched %d Fumos.", sum(len(l) for l in self.fumos.values()))
+                await self.favourites.prune(old_epoch)
+            except RedisError as exc_info:
+                self._log.warning("Failed to delete the old favourites", exc_info=exc_info)
+        return True
+
+    async def _timed_fetch(self) -> bool:
+        start = time.perf_counter()
+        success = await self.fetch_fumos()
+        self.last_refresh_duration = time.perf_counter() - start
+        if success:
+            self.last_refresh = discord.utils.utcnow()
+        return success
+
+    async def refresh(self) -> bool:
+        """
+        Refresh the catalog, joining the in-flight refresh if there's one.
+
+        The current catalog keeps being served until the new one is ready.
+        """
+        if not self._refresh_task or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._timed_fetch())
+        # Shielded so a cancelled command doesn't cancel everyone else's refresh
+        return await asyncio.shield(self._refresh_task)
+
+    @tasks.loop(minutes=60.0)
+    async def refresh_loop(self) -> None:
+        # An error would stop the loop for good
+        try:
+            await self.refresh()
+        except Exception as exc_info:
+            self._log.exception("Failed to refresh the Fumo catalog", exc_info=exc_info)
+        interval = self.bot.config.fumo_refresh_interval
+        if self.refresh_loop.minutes != interval:
+            self.refresh_loop.change_interval(minutes=interval)
+
+    async def load_snapshot(self) -> None:
+        """Load the last good catalog from Redis."""
+        snapshot = await CatalogSnapshot.load(self.bot.redis)
+        if not snapshot:
+            return
+        excluded = self.dead_links
+
+        def load() -> FumoCatalog:
+            catalog = FumoCatalog.from_bytes(snapshot.data, excluded=excluded)
+            for delta in snapshot.deltas:
+                catalog = catalog.patch(CatalogDelta.from_bytes(delta))
+            return catalog
+
+        try:
+            catalog = await self.bot.loop.run_in_executor(None, load)
+        except (TypeError, ValueError) as exc_info:
+            self._log.exception("Failed to parse the Fumo snapshot", exc_info=exc_info)
+            return
+        self.catalog = catalog
+        self.snapshot = snapshot
+        self.favourites.epoch = snapshot.epoch
+        self._log.info("Loaded %d Fumos from the snapshot.", len(self.catalog))
+
+    async def remap_favourites(self, old: FumoCatalog, new: FumoCatalog, data: bytes) -> str:
+        """
+        Copy the favourites to a new epoch for a full build, if the entries moved.
+
+        ``data`` is the new catalog dumped, the new epoch is its digest so a retry of the
+        same build reuses it. Returns the epoch the favourites are in for ``new``.
+        """
+        epoch = hashlib.blake2b(data, digest_size=8).hexdigest()
+        if not old:
+            # Without the catalog they're numbered for, favourites can't be renumbered.
+            # They're left in their epoch rather than pointing at other Fumos
+            self._log.warning("No catalog to renumber the favourite Fumos from.")
+            return epoch
+        mapping = await self.bot.loop.run_in_executor(None, new.index_map, old)
+        if mapping == list(range(len(mapping))):
+            return self.favourites.epoch
+        self.last_received.clear()
+        users = await self.favourites.remap(mapping, self.favourites.epoch, epoch)
+        self._log.info("Remapped the favourite Fumos of %d users.", users)
+        return epoch
+
+    async def exclude_dead_links(self, catalog: FumoCatalog) -> FumoCatalog:
+        """
+        Returns ``catalog`` leaving out the current dead links.
+
+        A catalog built or patched in an executor was given the dead links of when it
+        started, a link check may have changed them since.
+        """
+        while catalog.excluded != self.dead_links:
+            catalog = await self.bot.loop.run_in_executor(None, catalog.exclude, self.dead_links)
+        return catalog
+
+    @property
+    def dead_links(self) -> frozenset[str]:
+        return frozenset(
+            url for url, failures in self.link_failures.items() if failures >= MAX_LINK_FAILURES
+        )
+
+    async def check_links(self) -> None:
+        """
+        Check every catalog URL and leave the dead ones out of the sampling pools.
+
+        A link is dead once it's gone (404, 410), or it failed :data:`MAX_LINK_FAILURES`
+        checks in a row, so a timeout, a rate limit or a server error doesn't kill it.
+        A link serving a page rather than media, e.g. a landing page, counts as failing.
+        """
+        catalog = self.catalog
+        checked, failing = await self.link_checker.check_all(catalog.urls)
+        self.links_checked = checked
+        self.last_link_check = discord.utils.utcnow()
+        failures = {
+            url: (
+                MAX_LINK_FAILURES
+                if status.gone
+                else min(self.link_failures.get(url, 0) + 1, MAX_LINK_FAILURES)
+            )
+            for url, status in failing.items()
+        }
+        dead = sum(count >= MAX_LINK_FAILURES for count in failures.values())
+        if dead > checked * MAX_DEAD_SHARE:
+            # Likely an outage on our side or the hosts', the check tells nothing
+            self._log.warning("%d of %d Fumo links look dead, ignoring this check.", dead, checked)
+            return
+        self.link_failures = failures
+        self.link_statuses = failing
+        # Excluding rebuilds every pool, so only when the dead links changed, and off the loop
+        while self.catalog.excluded != self.dead_links:
+            catalog = self.catalog
+            excluded = await self.bot.loop.run_in_executor(None, catalog.exclude, self.dead_links)
+            # A refresh swapped in a catalog meanwhile, it left the dead links out itself
+            if self.catalog is catalog:
+                self.catalog = excluded
+        self._log.info("Checked %d Fumo links, %d are dead.", checked, len(self.dead_links))
+
+    @tasks.loop(hours=6.0)
+    async def link_check_loop(self) -> None:
+        await self.check_links()
+
+    @link_check_loop.before_loop
+    async def before_link_check_loop(self) -> None:
+        await self.bot.wait_until_ready()
 
     async def cog_load(self) -> None:
         super().cog_load()
-        await self.fetch_fumos()
+        self.link_checker = LinkChecker(self.bot.session)
+        self.favourites = Favourites(self.bot.redis)
+        self.thumbnails = ThumbnailCache(self.bot.session, THUMBNAILS_PATH)
+        self.guild_filters = {
+            int(guild_id): int(mask)
+            for guild_id, mask in (await self.bot.redis.hgetall(FILTERS_KEY)).items()
+        }
+        await self.load_snapshot()
+        # Don't let startup wait on the network, the snapshot is served meanwhile
+        self.refresh_loop.change_interval(minutes=self.bot.config.fumo_refresh_interval)
+        self.refresh_loop.start()
+        self.link_check_loop.start()
+
+    async def cog_unload(self) -> None:
+        super().cog_unload()
+        self.refresh_loop.cancel()
+        self.link_check_loop.cancel()
+        if self._refresh_task:
+            self._refresh_task.cancel()
+
+    @commands.is_owner()
+    @commands.group(name="catalog", invoke_without_command=True)
+    async def _catalog(self, ctx: commands.Context):
+        """Show the Fumo catalog's status."""
+        embed = discord.Embed(color=ctx.embed_color, title="Fumo Catalog")
+        sizes = self.catalog.sizes
+        embed.add_field(
+            name="Fumos",
+            value="\n".join(f"{name.title()}: {size}" for name, size in sorted(sizes.items())),
+        )
+        last_refresh = "Never"
+        if self.last_refresh:
+            last_refresh = discord.utils.format_dt(self.last_refresh, "R")
+        embed.add_field(name="Last Refresh", value=last_refresh)
+        duration = "N/A"
+        if self.last_refresh_duration is not None:
+            duration = f"{self.last_refresh_duration * 1000:.2f} ms"
+        embed.add_field(name="Refresh Duration", value=duration)
+        if self.last_link_check:
+            checked = discord.utils.format_dt(self.last_link_check, "R")
+            embed.add_field(
+                name="Links",
+                value=f"{len(self.catalog.excluded)} dead, checked {checked}",
+            )
+        latencies = [
+            f"{url}: {self.mirrors.latencies[url] * 1000:.0f} ms"
+            for url in self.mirrors.ordered(self.bot.config.fumo_mirrors)
+            if url in self.mirrors.latencies
+        ]
+        if latencies:
+            embed.add_field(name="Mirrors", value="\n".join(latencies), inline=False)
+        thumbnails = self.thumbnails
+        if thumbnails.hits or thumbnails.misses:
+            embed.add_field(
+                name="Thumbnails",
+                value=(
+                    f"{thumbnails.memory_size / 1024**2:.1f} MiB in memory\n"
+                    f"{thumbnails.disk_size / 1024**2:.1f} MiB on disk\n"
+                    f"{thumbnails.hits / (thumbnails.hits + thumbnails.misses):.0%} hit rate"
+                ),
+            )
+        if self.refresh_loop.next_iteration:
+            next_refresh = discord.utils.format_dt(self.refresh_loop.next_iteration, "R")
+            embed.add_field(name="Next Refresh", value=next_refresh)
+        await ctx.send(embed=embed)
+
+    @_catalog.command(name="refresh")
+    async def catalog_refresh(self, ctx: commands.Context):
+        """Refresh the Fumo catalog now."""
+        async with ctx.typing():
+            success = await self.refresh()
+        await (ctx.tick() if success else ctx.cross())
+
+    @_catalog.command(name="check")
+    async def catalog_check(self, ctx: commands.Context):
+        """Check every Fumo link now."""
+        async with ctx.typing():
+            await self.check_links()
+        embed = discord.Embed(color=ctx.embed_color, title="Fumo Links")
+        embed.description = (
+            f"{len(self.catalog.excluded)} dead links out of {self.links_checked}, "
+            f"{len(self.link_statuses)} failing or suspicious."
+        )
+        # The ones closest to being left out first
+        failing = sorted(self.link_statuses.items(), key=lambda item: -self.link_failures[item[0]])
+        for url, status in failing[:MAX_SHOWN_LINKS]:
+            details = [
+                str(status.status or "No response"),
+                status.content_type or "No content type",
+                f"{status.size} bytes" if status.size is not None else "Unknown size",
+                f"failed {self.link_failures[url]}/{MAX_LINK_FAILURES} checks",
+            ]
+            embed.add_field(name=url[-256:], value=" · ".join(details), inline=False)
+        await ctx.send(embed=embed)
 
     @commands.command()
-    async def random(self, ctx: commands.Context):
-        """Get a random Fumo"""
+    async def random(self, ctx: commands.Context, amount: commands.Range[int, 1, 10] = 1):
+        """Get a random Fumo, or up to 10 of them at once"""
 
-        await self.summon_fumo(ctx)
+        await self.summon_fumo(ctx, amount=amount)
 
     @commands.command()
-    async def image(self, ctx: commands.Context):
-        """Get a random Fumo image"""
+    async def image(self, ctx: commands.Context, amount: commands.Range[int, 1, 10] = 1):
+        """Get a random Fumo image, or up to 10 of them at once"""
 
-        await self.summon_fumo(ctx, "image")
+        await self.summon_fumo(ctx, "image", amount)
 
     @commands.command()
-    async def gif(self, ctx: commands.Context):
-        """Get a random Fumo GIF"""
+    async def gif(self, ctx: commands.Context, amount: commands.Range[int, 1, 10] = 1):
+        """Get a random Fumo GIF, or up to 10 of them at once"""
 
-        await self.summon_fumo(ctx, "gif")
+        await self.summon_fumo(ctx, "gif", amount)
 
     @commands.command()
     async def video(self, ctx: commands.Context):
@@ -66,39 +486,222 @@ class Fumo(commands.Cog):
 
         await self.summon_fumo(ctx, "friday")
 
+    @commands.command(aliases=["find"])
+    async def search(self, ctx: commands.Context, *, query: str):
+        """Get a random Fumo matching a name, character or tag"""
+
+        disabled = self.guild_filters.get(ctx.guild.id, 0) if ctx.guild else 0
+        if not self.catalog:
+            await self.refresh()
+        result = self.catalog.search(query, friday=self.is_friday(), disabled=disabled)
+        if not result:
+            await ctx.send("I couldn't find any Fumos matching that.")
+            return
+        await self.send_fumos(ctx, self.catalog, result.sample(1))
+
+    @commands.bot_has_permissions(attach_files=True)
+    @commands.cooldown(1, 5, commands.BucketType.user)
+    @commands.command(aliases=["grid"])
+    async def gallery(self, ctx: commands.Context, columns: commands.Range[int, 2, 5] = 4):
+        """Get a grid of random Fumo images, up to 5 by 5"""
+
+        # Videos can't be thumbnailed
+        disabled = self.guild_filters.get(ctx.guild.id, 0) if ctx.guild else 0
+        disabled |= CONTENT_FLAGS["video"]
+        all_fumos = await self.get_fumos(disabled=disabled)
+        if not all_fumos:
+            await ctx.send("I couldn't find any Fumos right now. Please try again later.")
+            return
+        async with ctx.typing():
+            positions = self.pick((ctx.channel.id, "gallery", disabled), all_fumos, columns**2)
+            urls = [all_fumos[position].url for position in positions]
+            thumbnails = await self.thumbnails.get_many(urls)
+            if not any(thumbnails):
+                await ctx.send("I couldn't load any Fumos right now. Please try again later.")
+                return
+            task = functools.partial(compose_grid, thumbnails, columns, self.thumbnails.size)
+            data = await self.bot.loop.run_in_executor(None, task)
+        self.remember(ctx, [all_fumos.indices[position] for position in positions])
+        embed = discord.Embed(color=ctx.embed_color, title="Here's a Fumo gallery! ᗜˬᗜ")
+        embed.set_image(url="attachment://gallery.png")
+        await ctx.send(embed=embed, file=discord.File(BytesIO(data), "gallery.png"))
+
+    @commands.group(name="favourite", aliases=["favorite", "fav"], invoke_without_command=True)
+    async def favourite(self, ctx: commands.Context, *, url: Optional[str] = None):
+        """Favourite the Fumos you last got in this channel, or a Fumo by its URL"""
+
+        async with self.favourites_lock:
+            indices = await self._favourite_targets(ctx, url)
+            if not indices:
+                return
+            added = await self.favourites.add(ctx.author.id, indices)
+        await ctx.send(f"Added {added} Fumo{'s' if added != 1 else ''} to your favourites.")
+
+    @favourite.command(name="remove", aliases=["delete"])
+    async def favourite_remove(self, ctx: commands.Context, *, url: Optional[str] = None):
+        """Unfavourite the Fumos you last got in this channel, or a Fumo by its URL"""
+
+        async with self.favourites_lock:
+            indices = await self._favourite_targets(ctx, url)
+            if not indices:
+                return
+            removed = await self.favourites.remove(ctx.author.id, indices)
+        await ctx.send(
+            f"Removed {removed} Fumo{'s' if removed != 1 else ''} from your favourites."
+        )
+
+    @favourite.command(name="random")
+    async def favourite_random(
+        self, ctx: commands.Context, amount: commands.Range[int, 1, 10] = 1
+    ):
+        """Get a random Fumo from your favourites, or up to 10 of them at once"""
+
+        disabled = self.guild_filters.get(ctx.guild.id, 0) if ctx.guild else 0
+        if not self.catalog:
+            await self.refresh()
+        async with self.favourites_lock:
+            catalog = self.catalog
+            bitmap = await self.favourites.bitmap(ctx.author.id)
+        result = catalog.select(bitmap, friday=self.is_friday(), disabled=disabled)
+        if not result:
+            await ctx.send("You don't have any favourite Fumos to get here.")
+            return
+        await self.send_fumos(ctx, catalog, result.sample(amount))
+
+    @favourite.command(name="count")
+    async def favourite_count(self, ctx: commands.Context):
+        """Show how many favourite Fumos you have"""
+
+        count = await self.favourites.count(ctx.author.id)
+        await ctx.send(f"You have {count} favourite Fumo{'s' if count != 1 else ''}.")
+
+    @favourite.command(name="clear")
+    async def favourite_clear(self, ctx: commands.Context):
+        """Remove all of your favourite Fumos"""
+
+        await self.favourites.clear(ctx.author.id)
+        await ctx.tick()
+
+    async def _favourite_targets(self, ctx: commands.Context, url: Optional[str]) -> list[int]:
+        """Returns the catalog indices to (un)favourite, replying if there are none."""
+        if url is None:
+            indices = self.last_received.get((ctx.channel.id, ctx.author.id))
+            if not indices:
+                await ctx.send("You haven't got any Fumos in this channel recently.")
+                return []
+            return indices
+        index = self.catalog.find(url.strip("<>"))
+        if index is None:
+            await ctx.send("That Fumo isn't in the catalog.")
+            return []
+        return [index]
+
+    @commands.guild_only()
+    @commands.has_guild_permissions(manage_guild=True)
+    @commands.group(name="fumofilter", aliases=["fumofilters"], invoke_without_command=True)
+    async def fumo_filter(self, ctx: commands.Context):
+        """Show which kinds of Fumos are disabled in this server."""
+        disabled = self.guild_filters.get(ctx.guild.id, 0)
+        names = [name for name, flag in CONTENT_FLAGS.items() if disabled & flag]
+        if not names:
+            await ctx.send("No kinds of Fumos are disabled in this server.")
+            return
+        await ctx.send(f"Disabled in this server: {', '.join(names)}.")
+
+    @fumo_filter.command(name="disable")
+    async def fumo_filter_disable(
+        self, ctx: commands.Context, content_type: Literal["image", "gif", "video"]
+    ):
+        """Disable a kind of Fumos in this server."""
+        await self._set_filter(
+            ctx.guild, self.guild_filters.get(ctx.guild.id, 0) | CONTENT_FLAGS[content_type]
+        )
+        await ctx.tick()
+
+    @fumo_filter.command(name="enable")
+    async def fumo_filter_enable(
+        self, ctx: commands.Context, content_type: Literal["image", "gif", "video"]
+    ):
+        """Enable a kind of Fumos in this server."""
+        await self._set_filter(
+            ctx.guild, self.guild_filters.get(ctx.guild.id, 0) & ~CONTENT_FLAGS[content_type]
+        )
+        await ctx.tick()
+
+    async def _set_filter(self, guild: discord.Guild, mask: int) -> None:
+        if mask:
+            self.guild_filters[guild.id] = mask
+            await self.bot.redis.hset(FILTERS_KEY, guild.id, mask)
+        else:
+            self.guild_filters.pop(guild.id, None)
+            await self.bot.redis.hdel(FILTERS_KEY, guild.id)
+
     async def get_fumos(
-        self, content_type: Optional[Literal["friday", "gif", "image", "video"]] = None
-    ) -> list[str]:
-        if not self.fumos:
-            await self.fetch_fumos()
-        if not content_type:
-            fumos = self.fumos["image"] + self.fumos["gif"] + self.fumos["video"]
-            if self.is_friday():
-                fumos.extend(self.fumos["friday"])
-            return fumos
-        fumos = self.fumos[content_type]
-        if content_type == "video" and self.is_friday():
-            fumos.extend(self.fumos["friday"])
-        return fumos
+        self, content_type: Optional[ContentType] = None, *, disabled: int = 0
+    ) -> FumoPool:
+        if not self.catalog:
+            await self.refresh()
+        return self.catalog.get_pool(content_type, friday=self.is_friday(), disabled=disabled)
+
+    def draw(self, key: Hashable, pool: FumoPool) -> int:
+        """Draw an index from ``pool``, weighted if the pool is."""
+        if pool.alias:
+            return pool.alias.sample()
+        # One bag per channel, so busy channels don't see the same Fumos over and over
+        return self.sampler.draw(key, len(pool))
 
     async def summon_fumo(
         self,
         ctx: commands.Context,
-        content_type: Optional[Literal["friday", "gif", "image", "video"]] = None,
+        content_type: Optional[ContentType] = None,
+        amount: int = 1,
     ) -> None:
-        all_fumos = await self.get_fumos(content_type)
-        url = random.choice(all_fumos)
-        title = f"Here's a Random Fumo! ᗜˬᗜ"
-        if content_type:
-            title = f"Here's a Random Fumo {content_type}! ᗜˬᗜ"
-            if content_type == "friday":
-                title = "Happy Fumo Friday! ᗜˬᗜ"
-        if url[-3:] not in ("mp4", "mov"):
-            embed = discord.Embed(color=ctx.embed_color, title=title)
-            embed.set_image(url=url)
-            await ctx.send(embed=embed)
-        else:
-            await ctx.send(f"**{title}**\n{url}")
+        disabled = self.guild_filters.get(ctx.guild.id, 0) if ctx.guild else 0
+        if (
+            content_type
+            and disabled & CONTENT_FLAGS["video" if content_type == "friday" else content_type]
+        ):
+            await ctx.send("That kind of Fumo is disabled in this server.")
+            return
+        all_fumos = await self.get_fumos(content_type, disabled=disabled)
+        if not all_fumos:
+            await ctx.send("I couldn't find any Fumos right now. Please try again later.")
+            return
+        positions = self.pick((ctx.channel.id, content_type, disabled), all_fumos, amount)
+        indices = [all_fumos.indices[position] for position in positions]
+        await self.send_fumos(ctx, all_fumos.catalog, indices, content_type)
+
+    def pick(self, key: Hashable, pool: FumoPool, amount: int) -> list[int]:
+        """Draw up to ``amount`` distinct positions from ``pool``."""
+        amount = min(amount, len(pool))
+        picked = {}
+        # Weighted draws can repeat any number of times, so give up eventually
+        for _ in range(amount * 10):
+            picked[self.draw(key, pool)] = None
+            if len(picked) == amount:
+                break
+        return list(picked)
+
+    def remember(self, ctx: commands.Context, indices: Sequence[int]) -> None:
+        """Remember the Fumos someone got, so they can favourite them."""
+        key = (ctx.channel.id, ctx.author.id)
+        self.last_received[key] = list(indices)
+        self.last_received.move_to_end(key)
+        if len(self.last_received) > MAX_LAST_RECEIVED:
+            self.last_received.popitem(last=False)
+
+    async def send_fumos(
+        self,
+        ctx: commands.Context,
+        catalog: FumoCatalog,
+        indices: Sequence[int],
+        content_type: Optional[ContentType] = None,
+    ) -> None:
+        """Send the catalog entries at ``indices``, remembering them so they can be favourited."""
+        self.remember(ctx, indices)
+        entries = [catalog.entry(index) for index in indices]
+        for payload in build_batch_payloads(entries, content_type, ctx.embed_color):
+            await ctx.send(**payload)
 
 
 async def setup(bot: FumoBot):
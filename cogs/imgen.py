@@ -1,27 +1,67 @@
 import asyncio
 import base64
-import functools
 # import re
+from datetime import timedelta
 from io import BytesIO
 from pathlib import Path
-from typing import Literal
+from typing import Literal, Optional
 
 import discord
 # from discord import app_commands
-from PIL import Image
 
-from cogs.utils.imgen import NemusonaFlags  # NEMU_BUTTON, Model, NemusonaFlags, Prompt, RegenerateButton
+from cogs.utils.imgen import (  # NEMU_BUTTON, Model, NemusonaFlags, Prompt, RegenerateButton
+    NUMPY_AVAILABLE,
+    PROFILES,
+    TEMPLATES,
+    AvatarCache,
+    NemusonaFlags,
+    ProfileName,
+    QueueFull,
+    RenderCache,
+    Renderer,
+    RenderScheduler,
+)
 from core import commands
 from core.bot import FumoBot
 # from core.utils.views import FumoView
 
+RENDERS_PATH = Path(__file__).parent.parent / "cache" / "renders"
+
 
 class Imgen(commands.Cog):
     """Generate images."""
 
     def __init__(self, bot: FumoBot):
+        self.renderer: Optional[Renderer] = None
+        self.scheduler: Optional[RenderScheduler] = None
+        self.avatars = AvatarCache()
+        self.renders = RenderCache(RENDERS_PATH)
+        # Template name -> the encoding profile it's rendered with
+        self.profiles: dict[str, str] = {
+            name: template.profile for name, template in TEMPLATES.items()
+        }
         super().__init__(bot)
 
+    async def cog_load(self) -> None:
+        super().cog_load()
+        config = self.bot.config
+        compositor = config.imgen_compositor
+        if compositor == "numpy" and not NUMPY_AVAILABLE:
+            self._log.warning(
+                "The NumPy compositor isn't available here, compositing with Pillow instead."
+            )
+            compositor = "pillow"
+        self.renderer = Renderer(config.imgen_backend, config.imgen_workers, compositor)
+        # Warmed here so the first render doesn't wait on workers starting
+        await self.renderer.start()
+        # Past the workers, renders queue in the renderer too, where they're batched
+        self.scheduler = RenderScheduler(self.renderer.workers * 2)
+
+    async def cog_unload(self) -> None:
+        super().cog_unload()
+        self.renderer.shutdown()
+        self.avatars.clear()
+
     @property
     def display_emoji(self) -> discord.PartialEmoji:
         return discord.PartialEmoji(name="Sakuya", id=935836224483115048)
@@ -171,6 +211,100 @@ class Imgen(commands.Cog):
             file = discord.File(BytesIO(image), filename="image.png", spoiler=spoiler)
             return result["seed"], file
 
+    @commands.is_owner()
+    @commands.group(name="imgencache", invoke_without_command=True)
+    async def _imgencache(self, ctx: commands.Context):
+        """Show the Imgen caches' status."""
+        embed = discord.Embed(color=ctx.embed_color, title="Imgen Caches")
+        avatars = self.avatars
+        requests = avatars.hits + avatars.misses + avatars.shared
+        hit_rate = f"{avatars.hits / requests:.0%}" if requests else "N/A"
+        embed.add_field(
+            name="Avatars",
+            value=(
+                f"{len(avatars)} cached, {avatars.evictions} evicted\n"
+                f"{avatars.size / 1024**2:.1f} / {avatars.max_size / 1024**2:.0f} MiB\n"
+                f"{avatars.hits} hits, {avatars.misses} misses, {avatars.shared} shared\n"
+                f"{hit_rate} hit rate"
+            ),
+        )
+        renders = self.renders
+        hits = renders.memory_hits + renders.disk_hits
+        hit_rate = f"{hits / (hits + renders.misses):.0%}" if hits or renders.misses else "N/A"
+        embed.add_field(
+            name="Renders",
+            value=(
+                f"{renders.memory_size / 1024**2:.1f} MiB in memory\n"
+                f"{renders.disk_size / 1024**2:.1f} MiB on disk\n"
+                f"{renders.memory_hits} memory hits, {renders.disk_hits} disk hits\n"
+                f"{renders.misses} misses, {hit_rate} hit rate"
+            ),
+        )
+        await ctx.send(embed=embed)
+
+    @_imgencache.command(name="clear")
+    async def imgencache_clear(self, ctx: commands.Context):
+        """
+        Clear the Imgen caches.
+
+        Renders of a changed template are never sent, this frees the space they take.
+        """
+        self.avatars.clear()
+        async with ctx.typing():
+            await self.renders.clear()
+        await ctx.tick()
+
+    @commands.is_owner()
+    @commands.command()
+    async def imgenprofile(
+        self,
+        ctx: commands.Context,
+        profile: Optional[ProfileName] = None,
+        template: Optional[str] = None,
+    ):
+        """
+        Show or change how Imgen renders are encoded.
+
+        The **profile** can be either `fast` or `webp`.
+        Changes the **template**'s profile if given, otherwise every template's.
+        """
+        if profile is not None:
+            if template is not None and template not in self.profiles:
+                await ctx.send(f"There's no template called `{template}`.")
+                return
+            for name in [template] if template else self.profiles:
+                self.profiles[name] = profile
+        embed = discord.Embed(color=ctx.embed_color, title="Imgen Profiles")
+        embed.description = "\n".join(
+            f"{name}: `{profile}`" for name, profile in sorted(self.profiles.items())
+        )
+        await ctx.send(embed=embed)
+
+    @commands.is_owner()
+    @commands.command()
+    async def imgenqueue(self, ctx: commands.Context):
+        """Show the Imgen render queue's status."""
+        scheduler = self.scheduler
+        embed = discord.Embed(color=ctx.embed_color, title="Imgen Queue")
+        embed.add_field(
+            name="Renders",
+            value=(
+                f"{scheduler.running} / {scheduler.concurrency} running\n"
+                f"{scheduler.depth} waiting, {scheduler.peak_depth} at most\n"
+                f"{scheduler.completed} completed, {scheduler.rejected} rejected"
+            ),
+        )
+        embed.add_field(
+            name="Wait",
+            value=(
+                f"{scheduler.wait_percentile(0.5) * 1000:.0f} ms median\n"
+                f"{scheduler.wait_percentile(0.95) * 1000:.0f} ms 95th percentile\n"
+                f"{scheduler.estimate(scheduler.depth):.1f} s estimated now"
+            ),
+        )
+        embed.add_field(name="Render Duration", value=f"{scheduler.duration * 1000:.0f} ms")
+        await ctx.send(embed=embed)
+
     @commands.bot_has_permissions(attach_files=True)
     @commands.cooldown(1, 5, commands.BucketType.user)
     @commands.hybrid_command(aliases=["marihat", "hat"], cooldown_after_parsing=True)
@@ -180,16 +314,7 @@ class Imgen(commands.Cog):
 
         Credits to dj_tomato on Discord.
         """
-        async with ctx.typing():
-            avatar = await self.get_avatar(user)
-            task = functools.partial(self.generate_marisahat, avatar)
-            file = await self.make_image(task)
-        if not file:
-            await ctx.reply(
-                "An error occurred while generating the image. Please try again later."
-            )
-            return
-        await ctx.reply(file=file)
+        await self.send_image(ctx, "marisahat", user)
 
     @commands.bot_has_permissions(attach_files=True)
     @commands.cooldown(1, 5, commands.BucketType.user)
@@ -200,16 +325,7 @@ class Imgen(commands.Cog):
 
         Credits to dj_tomato on Discord.
         """
-        async with ctx.typing():
-            fp = await self.get_avatar(user)
-            task = functools.partial(self.generate_polaroid, fp)
-            file = await self.make_image(task)
-        if not file:
-            await ctx.reply(
-                "An error occurred while generating the image. Please try again later."
-            )
-            return
-        await ctx.reply(file=file)
+        await self.send_image(ctx, "polaroid", user)
 
     @commands.bot_has_permissions(attach_files=True)
     @commands.cooldown(1, 5, commands.BucketType.user)
@@ -220,10 +336,23 @@ class Imgen(commands.Cog):
 
         Credits to dj_tomato on Discord.
         """
-        async with ctx.typing():
-            fp = await self.get_avatar(user)
-            task = functools.partial(self.generate_selfie, fp)
-            file = await self.make_image(task)
+        await self.send_image(ctx, "selfie", user)
+
+    async def send_image(self, ctx: commands.Context, template: str, user: discord.User):
+        try:
+            async with ctx.typing():
+                avatar = await self.get_avatar(user)
+                file = await self.make_image(template, avatar, ctx.author.id)
+        except QueueFull as exc:
+            delay = discord.utils.format_dt(
+                discord.utils.utcnow() + timedelta(seconds=exc.retry_after), "R"
+            )
+            await ctx.reply(
+                f"Too many images are being generated right now. Try again {delay}.",
+                delete_after=max(exc.retry_after, 5),
+                mention_author=False,
+            )
+            return
         if not file:
             await ctx.reply(
                 "An error occurred while generating the image. Please try again later."
@@ -231,77 +360,31 @@ class Imgen(commands.Cog):
             return
         await ctx.reply(file=file)
 
-    async def get_avatar(self, user: discord.User) -> BytesIO:
-        avatar = BytesIO()
+    async def get_avatar(self, user: discord.User) -> bytes:
         display_avatar = user.display_avatar.replace(size=512, static_format="png")
-        await display_avatar.save(avatar, seek_begin=True)
-        return avatar
-
-    @staticmethod
-    def bytes_to_image(fp: BytesIO, size: int) -> Image.Image:
-        return Image.open(fp).convert("RGBA").resize((size, size), Image.Resampling.LANCZOS)
-
-    def generate_marisahat(self, fp: BytesIO) -> discord.File:
-        avatar = self.bytes_to_image(fp, 262)
-        image = Image.new("RGBA", (262, 262), None)
-        mask = Image.open(Path(__file__).parent / "utils/imgen/marisahat.png").convert("RGBA")
-        image.paste(avatar, (0, 0), avatar)
-        avatar.close()
-        image.paste(mask, (0, 0), mask)
-        mask.close()
-
-        fp = BytesIO()
-        image.save(fp, "PNG")
-        fp.seek(0)
-        image.close()
-        file = discord.File(fp, "marisahat.png")
-        fp.close()
-        return file
-
-    def generate_polaroid(self, fp: BytesIO) -> discord.File:
-        avatar = self.bytes_to_image(fp, 260)
-        image = Image.new("RGBA", (451, 600), None)
-        mask = Image.open(Path(__file__).parent / "utils/imgen/polaroid.png").convert("RGBA")
-        avatar = avatar.rotate(315, Image.Resampling.NEAREST, expand=1)
-        image.paste(avatar, (120, 200), avatar)
-        avatar.close()
-        image.paste(mask, (0, 0), mask)
-        mask.close()
-
-        fp = BytesIO()
-        image.save(fp, "PNG")
-        fp.seek(0)
-        image.close()
-        file = discord.File(fp, "polaroid.png")
-        fp.close()
-        return file
-
-    def generate_selfie(self, fp: BytesIO) -> discord.File:
-        avatar = self.bytes_to_image(fp, 577)
-        image = Image.new("RGBA", (433, 577), None)
-        mask = Image.open(Path(__file__).parent / "utils/imgen/selfie.png").convert("RGBA")
-        image.rotate(120, resample=0, expand=0, center=None, translate=None, fillcolor=None)
-        image.paste(avatar, (-33, 0), avatar)
-        avatar.close()
-        image.paste(mask, (0, 0), mask)
-        mask.close()
-
-        fp = BytesIO()
-        image.save(fp, "PNG")
-        fp.seek(0)
-        image.close()
-        file = discord.File(fp, "selfie.png")
-        fp.close()
-        return file
-
-    async def make_image(self, task: functools.partial) -> discord.File | None:
-        task = self.bot.loop.run_in_executor(None, task)
-        try:
-            image = await asyncio.wait_for(task, timeout=60)
-        except asyncio.TimeoutError:
-            return None
-        else:
-            return image
+        return await self.avatars.get(display_avatar)
+
+    async def make_image(
+        self, template: str, avatar: bytes, requester: int
+    ) -> discord.File | None:
+        """
+        Render ``template`` with an avatar, from the cache if it was rendered before.
+
+        Raises `QueueFull` if too many images are being rendered.
+        """
+        profile = self.profiles[template]
+        key = self.renders.key(template, avatar, profile)
+        image = await self.renders.get(key)
+        if image is None:
+            task = self.scheduler.run(
+                requester, lambda: self.renderer.render(template, avatar, profile)
+            )
+            try:
+                image = await asyncio.wait_for(task, timeout=60)
+            except asyncio.TimeoutError:
+                return None
+            await self.renders.put(key, image)
+        return discord.File(BytesIO(image), f"{template}.{PROFILES[profile].extension}")
 
 
 async def setup(bot: FumoBot):
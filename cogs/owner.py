@@ -196,6 +196,14 @@ class Owner(commands.Cog):
         config_dict = {
             "Description": config.description,
             "Embed Colour": "#" + hex(config.embed_colour.value)[2:],
+            "Fumo Mirrors": "\n".join(config.fumo_mirrors) or "None",
+            "Fumo Refresh Interval": f"{config.fumo_refresh_interval:g} minutes",
+            "Imgen Backend": (
+                f"Process pool, {config.imgen_workers or 'one per core'} workers"
+                if config.imgen_backend == "process"
+                else "Thread pool"
+            ),
+            "Imgen Compositor": config.imgen_compositor.title(),
             "Mobile": "Yes" if config.mobile else "No",
             "Permissions": format_perms(config.permissions, True),
             "Prefix": config.prefix,
@@ -218,6 +226,18 @@ class Owner(commands.Cog):
         self.bot._config.embed_colour = value
         await ctx.tick()
 
+    @config.command(name="fumorefresh", aliases=["fumorefreshinterval"])
+    async def config_fumo_refresh(
+        self, ctx: commands.Context, *, value: commands.Range[float, 1.0, None]
+    ):
+        """Set how often the Fumo catalog is refreshed, in minutes."""
+        self.bot._config.fumo_refresh_interval = value
+        fumo = self.bot.get_cog("Fumo")
+        if fumo is not None:
+            # Reschedules the next refresh, rather than waiting out the old interval
+            fumo.refresh_loop.change_interval(minutes=value)
+        await ctx.tick()
+
     @config.command(name="mobile")
     async def config_mobile(self, ctx: commands.Context, *, value: bool):
         """Set whether the bot should be on mobile status or not."""
@@ -0,0 +1,10 @@
+from .alias import *
+from .catalog import *
+from .favourites import *
+from .gallery import *
+from .health import *
+from .index import *
+from .mirrors import *
+from .parser import *
+from .sampler import *
+from .snapshot import *
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+import random
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Iterable, Optional
+
+__all__ = ("AliasTable", "CompositeAliasTable")
+
+
+class AliasTable:
+    """
+    Weighted sampling in constant time, using Vose's alias method.
+
+    Building the table is linear in the number of weights, so build it once and reuse it.
+    """
+
+    __slots__ = ("_alias", "_probability")
+
+    def __init__(self, weights: Iterable[float]) -> None:
+        weights = array("d", weights)
+        size = len(weights)
+        total = sum(weights)
+        if not size or total <= 0:
+            raise ValueError("At least one weight must be positive.")
+
+        scaled = array("d", (weight * size / total for weight in weights))
+        self._probability = array("f", bytes(4 * size))
+        self._alias = array("I", bytes(4 * size))
+        small = [i for i, weight in enumerate(scaled) if weight < 1.0]
+        large = [i for i, weight in enumerate(scaled) if weight >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1.0, give or take floating point errors
+        for i in large + small:
+            self._probability[i] = 1.0
+            self._alias[i] = i
+
+    def __len__(self) -> int:
+        return len(self._alias)
+
+    def sample(self, rng: Optional[random.Random] = None) -> int:
+        """Returns an index, with a probability proportional to its weight."""
+        rng = rng or random
+        index = rng.randrange(len(self._alias))
+        if rng.random() < self._probability[index]:
+            return index
+        return self._alias[index]
+
+
+class CompositeAliasTable:
+    """
+    Weighted sampling over consecutive parts, each with its own alias table.
+
+    Parts are ``(table, offset, length, weight)``, ``table`` being `None` if the part's
+    entries are equally likely and ``weight`` being the part's total weight. A part can
+    change without rebuilding the tables of the others.
+    """
+
+    __slots__ = ("_cumulative", "_parts")
+
+    def __init__(self, parts: Iterable[tuple[Optional[AliasTable], int, int, float]]) -> None:
+        self._parts = list(parts)
+        self._cumulative = array("d", accumulate(weight for *_, weight in self._parts))
+        if not self._parts or self._cumulative[-1] <= 0:
+            raise ValueError("At least one weight must be positive.")
+
+    def __len__(self) -> int:
+        _, offset, length, _ = self._parts[-1]
+        return offset + length
+
+    def sample(self, rng: Optional[random.Random] = None) -> int:
+        """Returns an index, with a probability proportional to its weight."""
+        rng = rng or random
+        part = bisect_right(self._cumulative, rng.random() * self._cumulative[-1])
+        table, offset, length, _ = self._parts[min(part, len(self._parts) - 1)]
+        return offset + (table.sample(rng) if table is not None else rng.randrange(length))
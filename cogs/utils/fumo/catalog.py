@@ -0,0 +1,862 @@
+from __future__ import annotations
+
+import json
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections.abc import Sequence
+from typing import Any, Iterable, Iterator, Literal, NamedTuple, Optional, overload
+
+import discord
+
+from .alias import AliasTable, CompositeAliasTable
+from .index import SearchResult, TokenIndex, filename_tokens, to_bitmap, tokenize
+from .parser import CatalogParser
+
+__all__ = (
+    "CONTENT_FLAGS",
+    "CatalogBuilder",
+    "CatalogDelta",
+    "ContentType",
+    "FumoCatalog",
+    "FumoEntry",
+    "FumoPool",
+    "MediaKind",
+    "build_batch_payloads",
+    "build_payload",
+    "classify",
+)
+
+ContentType = Literal["friday", "gif", "image", "video"]
+MediaKind = Literal["gif", "image", "video"]
+
+CONTENT_TYPES: tuple[ContentType, ...] = ("friday", "gif", "image", "video")
+KINDS: tuple[MediaKind, ...] = ("image", "gif", "video")
+# Bits of the per-guild filter masks, Friday videos count as videos
+CONTENT_FLAGS: dict[str, int] = {"image": 1 << 0, "gif": 1 << 1, "video": 1 << 2}
+VIDEO_EXTENSIONS = frozenset({b"m4v", b"mkv", b"mov", b"mp4", b"webm"})
+TITLES: dict[Optional[str], str] = {
+    None: "Here's a Random Fumo! ᗜˬᗜ",
+    "friday": "Happy Fumo Friday! ᗜˬᗜ",
+    "gif": "Here's a Random Fumo gif! ᗜˬᗜ",
+    "image": "Here's a Random Fumo image! ᗜˬᗜ",
+    "video": "Here's a Random Fumo video! ᗜˬᗜ",
+}
+
+# Snapshot format: magic, header length, JSON header, then the raw arrays and the arena
+_MAGIC = b"FUMOCAT1"
+_HEADER_LENGTH = struct.Struct("<I")
+# Past this many entries sharing a removed URL's file name tokens, the arena is searched instead
+_MAX_CANDIDATES = 1024
+
+
+def _classify(url: bytes) -> int:
+    path = url.partition(b"?")[0].partition(b"#")[0]
+    extension = path.rpartition(b"/")[2].rpartition(b".")[2].lower()
+    if extension in VIDEO_EXTENSIONS:
+        return 2
+    if extension == b"gif":
+        return 1
+    return 0
+
+
+def classify(url: str) -> MediaKind:
+    """Classify a URL's media kind from its file extension, ignoring case and query strings."""
+    return KINDS[_classify(url.encode())]
+
+
+def _contains(indices: array, i: int) -> bool:
+    """Returns whether the sorted ``indices`` contain ``i``."""
+    position = bisect_left(indices, i)
+    return position < len(indices) and indices[position] == i
+
+
+def _without(indices: array, removed: list[int]) -> array:
+    """Returns a copy of the sorted ``indices`` without the sorted ``removed`` ones."""
+    if len(removed) * 64 > len(indices):
+        skip = set(removed)
+        return array("I", (i for i in indices if i not in skip))
+    # A few removals, cheaper to find and delete than to filter everything
+    indices = array("I", indices)
+    for i in reversed(removed):
+        position = bisect_left(indices, i)
+        if position < len(indices) and indices[position] == i:
+            del indices[position]
+    return indices
+
+
+class FumoEntry(NamedTuple):
+    """A catalog entry, classified once when the catalog is loaded."""
+
+    url: str
+    kind: MediaKind
+
+    @classmethod
+    def from_url(cls, url: str) -> FumoEntry:
+        return cls(url, classify(url))
+
+
+def build_payload(
+    entry: FumoEntry, content_type: Optional[ContentType], colour: discord.Colour
+) -> dict[str, Any]:
+    """
+    Returns the keyword arguments to send ``entry`` with.
+
+    Videos can't be embedded, so they're sent as plain content instead.
+    """
+    title = TITLES[content_type]
+    if entry.kind == "video":
+        return {"content": f"**{title}**\n{entry.url}"}
+    embed = discord.Embed(color=colour, title=title)
+    embed.set_image(url=entry.url)
+    return {"embed": embed}
+
+
+def build_batch_payloads(
+    entries: Sequence[FumoEntry], content_type: Optional[ContentType], colour: discord.Colour
+) -> list[dict[str, Any]]:
+    """
+    Returns the keyword arguments to send up to 10 entries with, in as few messages as possible.
+
+    Images and GIFs are sent as one multi-embed message, videos as one content message.
+    """
+    if len(entries) == 1:
+        return [build_payload(entries[0], content_type, colour)]
+    payloads = []
+    embeds = [
+        build_payload(entry, content_type, colour)["embed"]
+        for entry in entries
+        if entry.kind != "video"
+    ]
+    if embeds:
+        payloads.append({"embeds": embeds})
+    videos = [entry.url for entry in entries if entry.kind == "video"]
+    if videos:
+        payloads.append({"content": "\n".join((f"**{TITLES[content_type]}**", *videos))})
+    return payloads
+
+
+class CatalogBuilder:
+    """
+    Builds a :class:`FumoCatalog` from catalog items, usually fed by a :class:`CatalogParser`.
+
+    URLs are appended to a single arena and are never decoded here.
+
+    Items can be plain URLs or objects with a ``url`` and an optional ``weight``,
+    ``name``, ``character`` and ``tags``, and a top-level ``weights`` object can weigh
+    whole content types. Entries are indexed by their file name and metadata.
+    A top-level ``version`` number lets the catalog be patched with a :class:`CatalogDelta`.
+    """
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        self._offsets = array("I", [0])
+        self._kinds = bytearray()
+        self._members = {content_type: array("I") for content_type in CONTENT_TYPES}
+        # Only allocated once an entry isn't weighted 1
+        self._weights: Optional[array] = None
+        self._type_weights: dict[str, float] = {}
+        self._index = TokenIndex()
+        self.version: Optional[int] = None
+
+    def add(
+        self,
+        content_type: ContentType,
+        url: bytes,
+        weight: float = 1.0,
+        tokens: Iterable[str] = (),
+    ) -> int:
+        """Add a URL to the catalog, returns its index."""
+        index = len(self._kinds)
+        self._index.add(index, (*filename_tokens(url), *tokens))
+        self._buffer += url
+        self._offsets.append(len(self._buffer))
+        self._kinds.append(_classify(url))
+        self._members[content_type].append(index)
+        if self._weights is None and weight != 1.0:
+            self._weights = array("f", [1.0]) * index
+        if self._weights is not None:
+            self._weights.append(weight)
+        return index
+
+    def add_item(self, key: str, item: bytes | Any) -> None:
+        """A :class:`CatalogParser` callback, ignores unknown keys and malformed items."""
+        if key not in self._members:
+            return
+        weight = 1.0
+        tokens = []
+        if isinstance(item, dict):
+            weight = item.get("weight", 1.0)
+            if not isinstance(weight, (int, float)) or weight < 0:
+                return
+            tags = item.get("tags")
+            tags = [*tags] if isinstance(tags, list) else []
+            tags.extend((item.get("name"), item.get("character")))
+            for tag in tags:
+                if isinstance(tag, str):
+                    tokens.extend(tokenize(tag))
+            item = item.get("url")
+            item = item.encode() if isinstance(item, str) else None
+        if isinstance(item, bytes) and item:
+            self.add(key, item, weight, tokens)
+
+    def add_value(self, key: str, value: Any) -> None:
+        """A :class:`CatalogParser` callback for top-level values that aren't lists."""
+        if key == "version" and type(value) is int:
+            self.version = value
+        elif key == "weights" and isinstance(value, dict):
+            self._type_weights = {
+                content_type: float(weight)
+                for content_type, weight in value.items()
+                if content_type in self._members
+                and isinstance(weight, (int, float))
+                and weight >= 0
+            }
+
+    def parser(self) -> CatalogParser:
+        """Returns a parser that feeds this builder."""
+        return CatalogParser(self.add_item, self.add_value)
+
+    def build(self, *, excluded: frozenset[str] = frozenset()) -> FumoCatalog:
+        self._index.freeze(len(self._kinds))
+        return FumoCatalog(
+            self._buffer,
+            self._offsets,
+            self._kinds,
+            self._members,
+            weights=self._weights,
+            type_weights=self._type_weights,
+            index=self._index,
+            excluded=excluded,
+            version=self.version,
+        )
+
+
+class CatalogDelta(CatalogBuilder):
+    """
+    The changes to a versioned catalog, see :meth:`FumoCatalog.patch`.
+
+    A delta document is shaped like a catalog document holding only the added items,
+    with the version it applies to and a list of removed URLs, e.g.::
+
+        {"version": 42, "since": 41, "image": ["https://..."], "removed": ["https://..."]}
+
+    A ``weights`` object replaces the catalog's content type weights.
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.since: Optional[int] = None
+        self.removed: list[bytes] = []
+        # Unlike a catalog, a delta without weights keeps the current ones
+        self._type_weights: Optional[dict[str, float]] = None
+
+    def __len__(self) -> int:
+        return len(self._kinds) + len(self.removed)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> CatalogDelta:
+        """Parse a delta document."""
+        delta = cls()
+        parser = delta.parser()
+        parser.feed(data)
+        parser.close()
+        return delta
+
+    def add_item(self, key: str, item: bytes | Any) -> None:
+        if key == "removed":
+            if isinstance(item, bytes) and item:
+                self.removed.append(item)
+            return
+        super().add_item(key, item)
+
+    def add_value(self, key: str, value: Any) -> None:
+        if key == "since" and type(value) is int:
+            self.since = value
+        else:
+            super().add_value(key, value)
+
+    def build(self, *, excluded: frozenset[str] = frozenset()) -> FumoCatalog:
+        raise TypeError("A delta can't be built on its own, patch a catalog with it.")
+
+
+class FumoPool(Sequence):
+    """A read-only view over catalog entries, decoded lazily when picked."""
+
+    __slots__ = ("_alias", "_catalog", "_indices", "_length")
+
+    def __init__(
+        self,
+        catalog: FumoCatalog,
+        indices: array,
+        length: Optional[int] = None,
+        alias: Optional[AliasTable | CompositeAliasTable] = None,
+    ) -> None:
+        self._catalog = catalog
+        self._indices = indices
+        self._length = len(indices) if length is None else length
+        self._alias = alias
+
+    def __len__(self) -> int:
+        return self._length
+
+    @overload
+    def __getitem__(self, index: int) -> FumoEntry: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> list[FumoEntry]: ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("pool index out of range")
+        return self._catalog.entry(self._indices[index])
+
+    def __repr__(self) -> str:
+        return f"<FumoPool length={self._length}>"
+
+    @property
+    def catalog(self) -> FumoCatalog:
+        """The catalog this pool's entries are from."""
+        return self._catalog
+
+    @property
+    def alias(self) -> Optional[AliasTable | CompositeAliasTable]:
+        """The alias table to sample this pool with, `None` if its entries are equally likely."""
+        return self._alias
+
+    @property
+    def indices(self) -> memoryview:
+        """The catalog indices of this pool's entries."""
+        return memoryview(self._indices)[: self._length]
+
+
+class FumoCatalog:
+    """
+    An immutable, precompiled view of the Fumo catalog.
+
+    Every pool a command can sample from is built once here, so picking a Fumo
+    never has to concatenate or copy lists nor classify URLs.
+
+    URLs live in one bytes arena with an offset per entry, and are only decoded
+    when picked, so each entry costs a few bytes on top of its URL. An entry keeps
+    its index when the catalog is patched, removed entries are left in the arena
+    as dead slots until the next full build.
+
+    The arena is only ever appended to, so a patched catalog shares it with the
+    catalog it was patched from, each one only reading its first ``count`` entries.
+    """
+
+    __slots__ = (
+        "_active",
+        "_bitmaps",
+        "_buffer",
+        "_count",
+        "_excluded",
+        "_filtered",
+        "_index",
+        "_kinds",
+        "_members",
+        "_offsets",
+        "_parts",
+        "_pools",
+        "_sizes",
+        "_skip",
+        "_type_weights",
+        "_version",
+        "_weights",
+    )
+
+    def __init__(
+        self,
+        buffer: bytearray,
+        offsets: array,
+        kinds: bytearray,
+        members: dict[str, array],
+        *,
+        count: Optional[int] = None,
+        weights: Optional[array] = None,
+        type_weights: Optional[dict[str, float]] = None,
+        index: Optional[TokenIndex] = None,
+        excluded: frozenset[str] = frozenset(),
+        skip: Optional[frozenset[int]] = None,
+        version: Optional[int] = None,
+        previous: Optional[FumoCatalog] = None,
+    ) -> None:
+        self._buffer = buffer
+        self._offsets = offsets
+        self._kinds = kinds
+        self._count = len(kinds) if count is None else count
+        self._members = members
+        self._weights = weights
+        self._type_weights = type_weights or {}
+        self._version = version
+        self._index = index if index is not None else self._reindex()
+        self._build(excluded, skip, previous)
+
+    def _reindex(self) -> TokenIndex:
+        """Index the entries by their file name, for catalogs dumped without an index."""
+        index = TokenIndex()
+        buffer, offsets = self._buffer, self._offsets
+        for i in range(self._count):
+            index.add(i, filename_tokens(buffer[offsets[i] : offsets[i + 1]]))
+        index.freeze(self._count)
+        return index
+
+    def _build(
+        self,
+        excluded: frozenset[str],
+        skip: Optional[frozenset[int]] = None,
+        previous: Optional[FumoCatalog] = None,
+    ) -> None:
+        """
+        Build the pools, ``skip`` being the indices of ``excluded`` if they're known already.
+
+        ``previous`` is the catalog this one was patched from, the alias tables and
+        bitmaps of content types the patch left alone are reused from it.
+        """
+        self._excluded = excluded
+        self._filtered: dict[tuple[int, bool], FumoPool] = {}
+        if skip is None:
+            skip = frozenset(self._find(excluded)) if excluded else frozenset()
+        self._skip = skip
+        members = self._members
+        if skip:
+            dead = sorted(skip)
+            members = {}
+            for content_type, indices in self._members.items():
+                if previous is not None and indices is previous._members[content_type]:
+                    # Left alone by the patch, so none of its entries are newly skipped
+                    members[content_type] = previous._active[content_type]
+                else:
+                    members[content_type] = _without(indices, dead)
+        self._active = members
+        # Entries never change weight, so content types left alone keep their alias table.
+        # Bitmaps are built here rather than on first search, catalogs are built off the loop
+        self._parts = {}
+        self._bitmaps: dict[str, int] = {}
+        for content_type, indices in members.items():
+            if previous is not None and indices is previous._active[content_type]:
+                self._parts[content_type] = previous._parts[content_type]
+                self._bitmaps[content_type] = previous._bitmaps[content_type]
+            else:
+                self._parts[content_type] = self._make_part(indices)
+                self._bitmaps[content_type] = to_bitmap(indices, self._count)
+        # Pools without Friday videos are prefixes of the ones with them
+        every, every_friday = self._make_pools(members, ("image", "gif", "video"), "friday")
+        video, video_friday = self._make_pools(members, ("video",), "friday")
+        (image,) = self._make_pools(members, ("image",))
+        (gif,) = self._make_pools(members, ("gif",))
+        (friday,) = self._make_pools(members, ("friday",))
+
+        # Keyed by (content type, is friday)
+        self._pools: dict[tuple[Optional[str], bool], FumoPool] = {
+            (None, False): every,
+            (None, True): every_friday,
+            ("image", False): image,
+            ("image", True): image,
+            ("gif", False): gif,
+            ("gif", True): gif,
+            ("video", False): video,
+            ("video", True): video_friday,
+            ("friday", False): friday,
+            ("friday", True): friday,
+        }
+        self._sizes = {content_type: len(members[content_type]) for content_type in CONTENT_TYPES}
+
+    def _make_part(self, indices: array) -> tuple[Optional[AliasTable], float, Optional[float]]:
+        """
+        Returns the alias table, total weight and common weight of the entries at ``indices``.
+
+        The table is `None` if they're equally likely, the common weight is `None` if they
+        aren't or if there are none. Content type weights aren't applied.
+        """
+        if self._weights is None:
+            return None, float(len(indices)), 1.0 if indices else None
+        weights = array("d", (self._weights[i] for i in indices))
+        if not weights:
+            return None, 0.0, None
+        low, high = min(weights), max(weights)
+        if low == high:
+            return None, low * len(weights), low
+        return AliasTable(weights), sum(weights), None
+
+    def _make_alias(
+        self, content_types: Iterable[str]
+    ) -> Optional[AliasTable | CompositeAliasTable]:
+        """Returns the table to sample the entries of ``content_types`` with, in that order."""
+        parts = []
+        weights = set()
+        offset = 0
+        for content_type in content_types:
+            alias, total, weight = self._parts[content_type]
+            length = len(self._active[content_type])
+            type_weight = self._type_weights.get(content_type, 1.0)
+            if length:
+                weights.add(None if weight is None else weight * type_weight)
+                # Parts weighted 0 are never picked
+                if total * type_weight > 0:
+                    parts.append((alias, offset, length, total * type_weight))
+            offset += length
+        # Entries all weighted 0 are taken as equally likely, like equal weights
+        if not parts or len(weights) == 1 and None not in weights:
+            return None
+        if len(parts) == 1 and parts[0][2] == offset:
+            return parts[0][0]
+        return CompositeAliasTable(parts)
+
+    def _make_pools(
+        self,
+        members: dict[str, array],
+        content_types: tuple[str, ...],
+        extra: Optional[str] = None,
+    ) -> tuple[FumoPool, ...]:
+        """
+        Returns a pool of ``content_types`` and, if ``extra`` is given, a pool with ``extra``.
+
+        Both share one index array, the first pool being a prefix of the second one.
+        Alias tables are only used for pools whose entries aren't equally likely.
+        """
+        length = sum(len(members[content_type]) for content_type in content_types)
+        if extra:
+            content_types = (*content_types, extra)
+        indices = array("I")
+        for content_type in content_types:
+            indices += members[content_type]
+        if not extra:
+            return (FumoPool(self, indices, length, self._make_alias(content_types)),)
+        return (
+            FumoPool(self, indices, length, self._make_alias(content_types[:-1])),
+            FumoPool(self, indices, len(indices), self._make_alias(content_types)),
+        )
+
+    def _find(self, urls: frozenset[str]) -> set[int]:
+        """Returns the indices of ``urls`` in the arena."""
+        raw = {url.encode() for url in urls}
+        buffer, offsets = self._buffer, self._offsets
+        return {i for i in range(self._count) if bytes(buffer[offsets[i] : offsets[i + 1]]) in raw}
+
+    def _locate(self, urls: Iterable[bytes]) -> set[int]:
+        """
+        Returns the indices of ``urls`` in the arena.
+
+        Cheaper than :meth:`_find` for a few URLs, the entries sharing a URL's file name
+        tokens are looked up in the index and compared. URLs without tokens, or with
+        tokens shared by too many entries, are searched for in the arena at C speed.
+        """
+        buffer, offsets = self._buffer, self._offsets
+        end = offsets[self._count]
+        found = set()
+        for url in urls:
+            tokens = filename_tokens(url)
+            if tokens:
+                candidates = self._index.lookup(tokens)
+                if len(candidates) <= _MAX_CANDIDATES:
+                    found.update(
+                        i for i in candidates if buffer[offsets[i] : offsets[i + 1]] == url
+                    )
+                    continue
+            position = buffer.find(url, 0, end)
+            while position != -1:
+                i = bisect_right(offsets, position, 0, self._count) - 1
+                # It may be part of a longer URL
+                if offsets[i] == position and offsets[i + 1] == position + len(url):
+                    found.add(i)
+                position = buffer.find(url, position + 1, end)
+        return found
+
+    def __len__(self) -> int:
+        return sum(self._sizes.values())
+
+    def __bool__(self) -> bool:
+        return len(self) > 0
+
+    @classmethod
+    def empty(cls) -> FumoCatalog:
+        return CatalogBuilder().build()
+
+    @classmethod
+    def from_bytes(cls, data: bytes, *, excluded: frozenset[str] = frozenset()) -> FumoCatalog:
+        """Load a catalog dumped with :meth:`to_bytes`, or parse a raw catalog document."""
+        if not data.startswith(_MAGIC):
+            builder = CatalogBuilder()
+            parser = builder.parser()
+            parser.feed(data)
+            parser.close()
+            return builder.build(excluded=excluded)
+
+        view = memoryview(data)
+        pos = len(_MAGIC)
+        (length,) = _HEADER_LENGTH.unpack_from(view, pos)
+        pos += _HEADER_LENGTH.size
+        header = json.loads(bytes(view[pos : pos + length]))
+        pos += length
+
+        def read_array(count: int, typecode: str = "I") -> array:
+            nonlocal pos
+            arr = array(typecode)
+            size = count * arr.itemsize
+            arr.frombytes(view[pos : pos + size])
+            pos += size
+            if header["byteorder"] != sys.byteorder:
+                arr.byteswap()
+            return arr
+
+        entries = header["entries"]
+        offsets = read_array(entries + 1)
+        kinds = bytearray(view[pos : pos + entries])
+        pos += entries
+        members = {name: read_array(count) for name, count in header["members"].items()}
+        weights = read_array(entries, "f") if header.get("weighted") else None
+        index = None
+        if "index" in header:
+            swap = header["byteorder"] != sys.byteorder
+            index = TokenIndex.from_bytes(view[pos : pos + header["index"]], swap=swap)
+            pos += header["index"]
+        buffer = bytearray(view[pos:])
+        return cls(
+            buffer,
+            offsets,
+            kinds,
+            members,
+            weights=weights,
+            type_weights=header.get("type_weights"),
+            index=index,
+            excluded=excluded,
+            version=header.get("version"),
+        )
+
+    def to_bytes(self) -> bytes:
+        """Dump the catalog to bytes, excluded entries are kept."""
+        count = self._count
+        index = self._index.to_bytes()
+        header = json.dumps(
+            {
+                "byteorder": sys.byteorder,
+                "entries": self._count,
+                "members": {name: len(indices) for name, indices in self._members.items()},
+                "weighted": self._weights is not None,
+                "type_weights": self._type_weights,
+                "index": len(index),
+                "version": self._version,
+            }
+        ).encode()
+        return b"".join(
+            (
+                _MAGIC,
+                _HEADER_LENGTH.pack(len(header)),
+                header,
+                self._offsets[: count + 1].tobytes(),
+                self._kinds[:count],
+                *(indices.tobytes() for indices in self._members.values()),
+                self._weights[:count].tobytes() if self._weights is not None else b"",
+                index,
+                self._buffer[: self._offsets[count]],
+            )
+        )
+
+    def entry(self, index: int) -> FumoEntry:
+        """Returns the entry at ``index`` in the arena."""
+        start, end = self._offsets[index], self._offsets[index + 1]
+        return FumoEntry(self._buffer[start:end].decode(), KINDS[self._kinds[index]])
+
+    @property
+    def urls(self) -> Iterator[str]:
+        """Every URL in the catalog, including excluded ones."""
+        buffer, offsets = self._buffer, self._offsets
+        for indices in self._members.values():
+            for i in indices:
+                yield buffer[offsets[i] : offsets[i + 1]].decode()
+
+    @property
+    def version(self) -> Optional[int]:
+        """The catalog's version, `None` if it isn't versioned."""
+        return self._version
+
+    @property
+    def dead_entries(self) -> int:
+        """The number of arena slots left behind by removed entries."""
+        return self._count - sum(len(indices) for indices in self._members.values())
+
+    @property
+    def excluded(self) -> frozenset[str]:
+        """The URLs left out of the sampling pools."""
+        return self._excluded
+
+    def exclude(self, urls: frozenset[str]) -> FumoCatalog:
+        """Returns a copy of this catalog whose pools leave out ``urls``."""
+        return type(self)(
+            self._buffer,
+            self._offsets,
+            self._kinds,
+            self._members,
+            count=self._count,
+            weights=self._weights,
+            type_weights=self._type_weights,
+            index=self._index,
+            excluded=urls,
+            version=self._version,
+        )
+
+    def patch(self, delta: CatalogDelta) -> FumoCatalog:
+        """
+        Returns a copy of this catalog with ``delta`` applied.
+
+        Added entries are appended to the arena and the index, and removed ones are
+        only dropped from the pools, so the work grows with the delta rather than with
+        the catalog: the arena is shared, and only the alias tables of content types
+        the delta touches are rebuilt. Raises `ValueError` if the delta isn't for this
+        catalog's version.
+        """
+        if delta.version is None or self._version is None or delta.since != self._version:
+            raise ValueError(
+                f"The delta from version {delta.since} doesn't apply to version {self._version}."
+            )
+        base = self._count
+        added = len(delta._kinds)
+        removed = sorted(self._locate(delta.removed)) if delta.removed else []
+        members = {}
+        for content_type, indices in self._members.items():
+            new = delta._members[content_type]
+            if new:
+                indices = indices + array("I", (i + base for i in new))
+            if any(_contains(indices, i) for i in removed):
+                indices = _without(indices, removed)
+            members[content_type] = indices
+
+        skip = self._skip
+        if self._excluded:
+            # Only the added entries can be newly excluded
+            raw = {url.encode() for url in self._excluded}
+            buffer, ends = bytes(delta._buffer), delta._offsets
+            skip = skip.union(
+                base + i for i in range(added) if buffer[ends[i] : ends[i + 1]] in raw
+            )
+
+        buffer, offsets, kinds, weights = self._arena()
+        end = len(buffer)
+        buffer += delta._buffer
+        offsets.extend(offset + end for offset in delta._offsets[1:])
+        kinds += delta._kinds
+        if weights is not None or delta._weights is not None:
+            if weights is None:
+                weights = array("f", [1.0]) * base
+            weights += delta._weights if delta._weights is not None else array("f", [1.0]) * added
+        type_weights = delta._type_weights
+        return type(self)(
+            buffer,
+            offsets,
+            kinds,
+            members,
+            count=base + added,
+            weights=weights,
+            type_weights=self._type_weights if type_weights is None else type_weights,
+            index=self._index.extended(delta._index, base, base + added),
+            excluded=self._excluded,
+            skip=skip,
+            version=delta.version,
+            previous=self,
+        )
+
+    def _arena(self) -> tuple[bytearray, array, bytearray, Optional[array]]:
+        """
+        Returns the arena, offsets, kinds and weights to append entries past this catalog's.
+
+        They're shared unless a catalog was already patched from this one, or from one of
+        the same version, then this catalog's part of them is copied.
+        """
+        count = self._count
+        weights = self._weights
+        if len(self._kinds) == count:
+            return self._buffer, self._offsets, self._kinds, weights
+        return (
+            self._buffer[: self._offsets[count]],
+            self._offsets[: count + 1],
+            self._kinds[:count],
+            weights[:count] if weights is not None else None,
+        )
+
+    @property
+    def sizes(self) -> dict[str, int]:
+        """The number of Fumos per content type."""
+        return self._sizes.copy()
+
+    def get_pool(
+        self,
+        content_type: Optional[ContentType] = None,
+        *,
+        friday: bool = False,
+        disabled: int = 0,
+    ) -> FumoPool:
+        """
+        Returns the prebuilt pool for the content type, including Friday videos on Fridays.
+
+        ``disabled`` is a mask of :data:`CONTENT_FLAGS` to leave out of the pool of every
+        content type. Those pools are built on first use and shared by every mask user.
+        """
+        if content_type or not disabled:
+            return self._pools[(content_type, friday)]
+        key = (disabled, friday)
+        pool = self._filtered.get(key)
+        if pool is None:
+            content_types = tuple(
+                content_type
+                for content_type in ("image", "gif", "video")
+                if not disabled & CONTENT_FLAGS[content_type]
+            )
+            extra = "friday" if friday and not disabled & CONTENT_FLAGS["video"] else None
+            pool = self._filtered[key] = self._make_pools(self._active, content_types, extra)[-1]
+        return pool
+
+    def _allowed_bitmap(self, friday: bool, disabled: int) -> int:
+        """Returns a bitmap of the entries :meth:`get_pool` would include."""
+        allowed = 0
+        for content_type in CONTENT_TYPES:
+            if content_type == "friday" and not friday:
+                continue
+            if disabled & CONTENT_FLAGS["video" if content_type == "friday" else content_type]:
+                continue
+            allowed |= self._bitmaps[content_type]
+        return allowed
+
+    def search(self, query: str, *, friday: bool = False, disabled: int = 0) -> SearchResult:
+        """
+        Returns the indices of the entries matching every word of ``query``.
+
+        Entries are matched by their file name and metadata, the same rules as
+        :meth:`get_pool` apply to which entries are included.
+        """
+        return self._index.search(query, self._allowed_bitmap(friday, disabled))
+
+    def select(self, bitmap: int, *, friday: bool = False, disabled: int = 0) -> SearchResult:
+        """
+        Returns the indices of the entries set in ``bitmap``, e.g. someone's favourites.
+
+        The same rules as :meth:`get_pool` apply to which entries are included.
+        """
+        return SearchResult(self._count, bitmap=bitmap & self._allowed_bitmap(friday, disabled))
+
+    def find(self, url: str) -> Optional[int]:
+        """Returns the index of ``url``, `None` if it isn't in the catalog."""
+        # Removed entries stay in the arena, only return a live one
+        for i in sorted(self._locate((url.encode(),)), reverse=True):
+            if any(_contains(indices, i) for indices in self._members.values()):
+                return i
+        return None
+
+    def index_map(self, old: FumoCatalog) -> list[int]:
+        """Returns the index in this catalog of every entry of ``old``, -1 for missing ones."""
+        buffer, offsets = self._buffer, self._offsets
+        indices = {
+            bytes(buffer[offsets[i] : offsets[i + 1]]): i
+            for members in self._members.values()
+            for i in members
+        }
+        buffer, offsets = old._buffer, old._offsets
+        return [
+            indices.get(bytes(buffer[offsets[i] : offsets[i + 1]]), -1) for i in range(old._count)
+        ]
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+from typing import AsyncIterator, Iterable, Optional, Sequence
+
+from redis.asyncio import Redis
+
+from .index import from_bitmap, to_bitmap
+
+__all__ = ("Favourites",)
+
+# Bitmaps from before epochs, numbered for the snapshots saved without one
+FAVOURITES_KEY = "fumo:favourites:{}"
+# Bitmaps numbered for the catalogs of an epoch, by epoch and user ID
+EPOCH_FAVOURITES_KEY = "fumo:favourites:{}:{}"
+
+# Redis numbers the bits of a byte from the most significant one, Python ints from the least
+_REVERSED = bytes(int(f"{byte:08b}"[::-1], 2) for byte in range(256))
+
+
+def from_redis_bitmap(data: bytes) -> int:
+    """Convert a bitmap built with ``SETBIT`` to an int whose bit ``i`` is offset ``i``."""
+    return int.from_bytes(data.translate(_REVERSED), "little")
+
+
+def to_redis_bitmap(bitmap: int) -> bytes:
+    """The inverse of :func:`from_redis_bitmap`."""
+    return bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little").translate(_REVERSED)
+
+
+class Favourites:
+    """
+    Per-user favourite Fumos, stored in Redis as bitmaps over catalog indices.
+
+    A favourite costs one bit, so a user's favourites take at most an eighth of a byte
+    per catalog entry. Catalog indices are stable across patches, when a full rebuild
+    renumbers them the bitmaps are copied to a new epoch with :meth:`remap`.
+
+    The bitmaps of each epoch have keys of their own, and ``epoch`` is the one in use,
+    saved with the catalog snapshot it numbers. A remap never touches the bitmaps it
+    reads, so one that fails partway can just be run again.
+    """
+
+    def __init__(self, redis: Redis, epoch: Optional[str] = None) -> None:
+        self.redis = redis
+        self.epoch = epoch
+
+    def _key(self, user_id: int | str, epoch: Optional[str]) -> str:
+        if epoch is None:
+            return FAVOURITES_KEY.format(user_id)
+        return EPOCH_FAVOURITES_KEY.format(epoch, user_id)
+
+    async def _keys(self, epoch: Optional[str]) -> AsyncIterator[str]:
+        """Yields the key of every bitmap of ``epoch``."""
+        prefix = self._key("", epoch)
+        async for key in self.redis.scan_iter(match=f"{prefix}*"):
+            key = key.decode() if isinstance(key, bytes) else key
+            # Bitmaps from before epochs share their prefix with every other epoch's
+            if key[len(prefix) :].isdigit():
+                yield key
+
+    async def add(self, user_id: int, indices: Iterable[int]) -> int:
+        """Favourite catalog entries, returns how many weren't favourited already."""
+        return await self._set(user_id, indices, 1)
+
+    async def remove(self, user_id: int, indices: Iterable[int]) -> int:
+        """Unfavourite catalog entries, returns how many were favourited."""
+        return await self._set(user_id, indices, 0)
+
+    async def _set(self, user_id: int, indices: Iterable[int], value: int) -> int:
+        key = self._key(user_id, self.epoch)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for index in indices:
+                pipe.setbit(key, index, value)
+            previous = await pipe.execute()
+        return sum(bit != value for bit in previous)
+
+    async def contains(self, user_id: int, index: int) -> bool:
+        return bool(await self.redis.getbit(self._key(user_id, self.epoch), index))
+
+    async def count(self, user_id: int) -> int:
+        return await self.redis.bitcount(self._key(user_id, self.epoch))
+
+    async def bitmap(self, user_id: int) -> int:
+        """Returns the user's favourites as an int bitmap, see :meth:`FumoCatalog.select`."""
+        data = await self.redis.get(self._key(user_id, self.epoch))
+        return from_redis_bitmap(data) if data else 0
+
+    async def clear(self, user_id: int) -> None:
+        await self.redis.delete(self._key(user_id, self.epoch))
+
+    async def remap(self, mapping: Sequence[int], old: Optional[str], new: str) -> int:
+        """
+        Copy every user's favourites from epoch ``old`` to epoch ``new``, renumbered.
+
+        ``mapping`` is the new index of each old one, entries mapped to -1 are gone and
+        are dropped. Bitmaps left in ``new`` by an earlier attempt are replaced, and the
+        ones of ``old`` are kept, see :meth:`prune`. Returns the number of users copied.
+        Nothing may change the favourites meanwhile.
+        """
+        stale = [key async for key in self._keys(new)]
+        if stale:
+            await self.redis.delete(*stale)
+        prefix = self._key("", old)
+        remapped = 0
+        async for key in self._keys(old):
+            data = await self.redis.get(key)
+            indices = [
+                mapping[index]
+                for index in from_bitmap(from_redis_bitmap(data or b""))
+                if index < len(mapping) and mapping[index] >= 0
+            ]
+            if indices:
+                bitmap = to_redis_bitmap(to_bitmap(indices, max(indices) + 1))
+                await self.redis.set(self._key(key[len(prefix) :], new), bitmap)
+                remapped += 1
+        return remapped
+
+    async def prune(self, epoch: Optional[str]) -> int:
+        """Delete the bitmaps of ``epoch``, returns how many there were."""
+        keys = [key async for key in self._keys(epoch)]
+        if keys:
+            await self.redis.delete(*keys)
+        return len(keys)
@@ -0,0 +1,135 @@
+from __future__ import annotations
+
+import asyncio
+import hashlib
+from io import BytesIO
+from pathlib import Path
+from typing import Iterable, Optional, Sequence
+
+import aiohttp
+from PIL import Image
+
+from core.utils.cache import TieredCache
+
+__all__ = ("ThumbnailCache", "compose_grid", "make_thumbnail")
+
+# Bigger downloads are skipped rather than thumbnailed
+MAX_DOWNLOAD_SIZE = 16 * 1024 * 1024
+
+
+def make_thumbnail(data: bytes, size: int) -> bytes:
+    """Returns a PNG thumbnail fitting in a ``size`` square, the first frame for GIFs."""
+    with Image.open(BytesIO(data)) as image:
+        # Lets JPEGs be decoded at a fraction of their size
+        image.draft("RGB", (size, size))
+        image = image.convert("RGBA")
+    image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    fp = BytesIO()
+    image.save(fp, "PNG")
+    image.close()
+    return fp.getvalue()
+
+
+def compose_grid(
+    thumbnails: Sequence[Optional[bytes]], columns: int, size: int, padding: int = 4
+) -> bytes:
+    """Returns a PNG of the thumbnails laid out in a grid, centered in their cells."""
+    rows = -(-len(thumbnails) // columns)
+    cell = size + padding
+    image = Image.new("RGBA", (columns * cell + padding, rows * cell + padding), None)
+    for position, thumbnail in enumerate(thumbnails):
+        if thumbnail is None:
+            continue
+        with Image.open(BytesIO(thumbnail)) as tile:
+            row, column = divmod(position, columns)
+            x = padding + column * cell + (size - tile.width) // 2
+            y = padding + row * cell + (size - tile.height) // 2
+            tile = tile.convert("RGBA")
+            image.paste(tile, (x, y), tile)
+    fp = BytesIO()
+    image.save(fp, "PNG", compress_level=1)
+    image.close()
+    return fp.getvalue()
+
+
+class ThumbnailCache:
+    """
+    Thumbnails of catalog images by URL, in a memory LRU backed by a disk LRU.
+
+    Both tiers are bounded by their size in bytes. Misses are downloaded concurrently,
+    concurrent requests for one URL share a download, and decoding happens in
+    the default executor so the event loop isn't blocked.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        directory: Path,
+        *,
+        size: int = 128,
+        max_memory: int = 32 * 1024 * 1024,
+        max_disk: int = 256 * 1024 * 1024,
+        concurrency: int = 8,
+        timeout: float = 10.0,
+    ) -> None:
+        self.session = session
+        self.size = size
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._cache = TieredCache(
+            directory, max_memory=max_memory, max_disk=max_disk, suffix=".png"
+        )
+        self._pending: dict[str, asyncio.Task[Optional[bytes]]] = {}
+
+    async def get(self, url: str) -> Optional[bytes]:
+        """Returns the thumbnail of ``url``, `None` if it couldn't be made."""
+        task = self._pending.get(url)
+        if task is None:
+            task = self._pending[url] = asyncio.create_task(self._load(url))
+            task.add_done_callback(lambda _: self._pending.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def get_many(self, urls: Iterable[str]) -> list[Optional[bytes]]:
+        """Returns the thumbnails of ``urls`` in order, fetching the missing ones concurrently."""
+        return await asyncio.gather(*(self.get(url) for url in urls))
+
+    async def _load(self, url: str) -> Optional[bytes]:
+        key = hashlib.sha1(url.encode()).hexdigest()
+        data = await self._cache.get(key)
+        if data is not None:
+            return data
+        try:
+            async with self._semaphore, self.session.get(url, timeout=self.timeout) as resp:
+                resp.raise_for_status()
+                if (resp.content_length or 0) > MAX_DOWNLOAD_SIZE:
+                    return None
+                raw = bytearray()
+                async for chunk in resp.content.iter_chunked(64 * 1024):
+                    raw += chunk
+                    if len(raw) > MAX_DOWNLOAD_SIZE:
+                        return None
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, make_thumbnail, bytes(raw), self.size)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return None
+        except (Image.DecompressionBombError, OSError, ValueError):
+            # Not an image Pillow can read
+            return None
+        await self._cache.put(key, data)
+        return data
+
+    @property
+    def hits(self) -> int:
+        return self._cache.memory_hits + self._cache.disk_hits
+
+    @property
+    def misses(self) -> int:
+        return self._cache.misses
+
+    @property
+    def memory_size(self) -> int:
+        return self._cache.memory_size
+
+    @property
+    def disk_size(self) -> int:
+        return self._cache.disk_size
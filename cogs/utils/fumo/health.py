@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+from urllib.parse import urlsplit
+
+import aiohttp
+
+__all__ = ("LinkChecker", "LinkStatus")
+
+# Statuses that mean the link is gone, anything else that isn't OK may be temporary
+GONE_STATUSES = frozenset({404, 410})
+# Content types of pages rather than media, e.g. a host's landing or error page served with a 200
+PAGE_TYPES = ("text/", "application/xhtml+xml", "application/json")
+
+
+@dataclass(frozen=True)
+class LinkStatus:
+    """
+    The result of checking a catalog URL.
+
+    Attributes
+    ----------
+    status: Optional[:class:`int`]
+        The HTTP status, `None` if the request itself failed.
+    content_type: Optional[:class:`str`]
+        The ``Content-Type`` header, if any.
+    size: Optional[:class:`int`]
+        The ``Content-Length`` header, if any.
+    checked_at: :class:`float`
+        When the URL was checked, as a UNIX timestamp.
+    """
+
+    status: Optional[int]
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+    checked_at: float = field(default_factory=time.time)
+
+    @property
+    def ok(self) -> bool:
+        return self.status is not None and 200 <= self.status < 400
+
+    @property
+    def suspicious(self) -> bool:
+        """Whether the link answers, but with a page rather than media."""
+        return self.ok and (self.content_type or "").lower().startswith(PAGE_TYPES)
+
+    @property
+    def healthy(self) -> bool:
+        return self.ok and not self.suspicious
+
+    @property
+    def gone(self) -> bool:
+        """Whether the server said the link is gone for good, rather than it failing for now."""
+        return self.status in GONE_STATUSES
+
+
+class LinkChecker:
+    """
+    HEAD-checks URLs in batches with a global and a per-host concurrency limit.
+
+    The session is passed in rather than owned, so the checker can be pointed at any server.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        *,
+        concurrency: int = 16,
+        per_host: int = 4,
+        batch_size: int = 256,
+        timeout: float = 10.0,
+    ) -> None:
+        self.session = session
+        self.batch_size = batch_size
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._host_semaphores: defaultdict[str, asyncio.Semaphore] = defaultdict(
+            lambda: asyncio.Semaphore(per_host)
+        )
+
+    async def _request(self, method: str, url: str, **kwargs) -> LinkStatus:
+        async with self.session.request(
+            method, url, allow_redirects=True, timeout=self.timeout, **kwargs
+        ) as resp:
+            size = resp.headers.get("Content-Length")
+            return LinkStatus(
+                status=resp.status,
+                content_type=resp.headers.get("Content-Type"),
+                size=int(size) if size and size.isdigit() else None,
+            )
+
+    async def check(self, url: str) -> LinkStatus:
+        """Check a single URL."""
+        host = urlsplit(url).hostname or ""
+        async with self._semaphore, self._host_semaphores[host]:
+            try:
+                status = await self._request("HEAD", url)
+                if status.status in (405, 501):
+                    # Some hosts don't support HEAD, ask for the first byte instead
+                    status = await self._request("GET", url, headers={"Range": "bytes=0-0"})
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+                return LinkStatus(status=None)
+            return status
+
+    async def check_all(self, urls: Iterable[str]) -> tuple[int, dict[str, LinkStatus]]:
+        """
+        Check every URL, ``batch_size`` at a time.
+
+        Returns how many URLs were checked and the statuses of those that aren't healthy,
+        i.e. failing or suspicious, the healthy ones aren't kept.
+        """
+        failing = {}
+        urls = list(dict.fromkeys(urls))
+        for start in range(0, len(urls), self.batch_size):
+            batch = urls[start : start + self.batch_size]
+            statuses = await asyncio.gather(*map(self.check, batch))
+            failing.update(
+                (url, status) for url, status in zip(batch, statuses) if not status.healthy
+            )
+        return len(urls), failing
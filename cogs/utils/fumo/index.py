@@ -0,0 +1,235 @@
+from __future__ import annotations
+
+import json
+import random
+import re
+import struct
+import unicodedata
+from array import array
+from bisect import bisect_left
+from typing import Iterable, Iterator, Optional, Union
+from urllib.parse import unquote
+
+__all__ = ("SearchResult", "TokenIndex", "tokenize")
+
+_CAMEL_CASE = re.compile(r"(?<=[a-z])(?=[A-Z])")
+_WORD = re.compile(r"[a-z]{2,}")
+_NONZERO = re.compile(rb"[^\x00]")
+_HEADER_LENGTH = struct.Struct("<I")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split text into normalized tokens, e.g. ``"ReimuHakurei_02"`` -> ``["reimu", "hakurei"]``."""
+    text = _CAMEL_CASE.sub(" ", text)
+    text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode().lower()
+    return _WORD.findall(text)
+
+
+def filename_tokens(url: bytes) -> list[str]:
+    """Returns the tokens of a URL's file name, without its extension."""
+    path = url.partition(b"?")[0].partition(b"#")[0]
+    name = path.rpartition(b"/")[2]
+    name = name.rpartition(b".")[0] or name
+    return tokenize(unquote(name.decode("utf-8", "replace")))
+
+
+def to_bitmap(indices: Iterable[int], size: int) -> int:
+    """Returns a bitmap with the bits of ``indices`` set."""
+    bits = bytearray((size + 7) // 8)
+    for i in indices:
+        bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, "little")
+
+
+def from_bitmap(bitmap: int) -> list[int]:
+    """Returns the sorted indices of the bits set in ``bitmap``."""
+    indices = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for match in _NONZERO.finditer(data):
+        byte, base = data[match.start()], match.start() * 8
+        indices.extend(base + bit for bit in range(8) if byte >> bit & 1)
+    return indices
+
+
+class SearchResult:
+    """The entries matching a search, kept as a bitmap when there are a lot of them."""
+
+    __slots__ = ("_bitmap", "_count", "_indices", "_size")
+
+    def __init__(self, size: int, *, indices: Optional[list[int]] = None, bitmap: int = 0) -> None:
+        self._size = size
+        self._indices = indices
+        self._bitmap = bitmap
+        self._count = len(indices) if indices is not None else bitmap.bit_count()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __iter__(self) -> Iterator[int]:
+        if self._indices is None:
+            self._indices = from_bitmap(self._bitmap)
+        return iter(self._indices)
+
+    def sample(self, amount: int) -> list[int]:
+        """Returns up to ``amount`` distinct matching indices, picked at random."""
+        amount = min(amount, self._count)
+        if self._indices is None and self._count * 64 < self._size:
+            # Too sparse to probe at random, but cheap to list
+            self._indices = from_bitmap(self._bitmap)
+        if self._indices is not None:
+            return random.sample(self._indices, amount)
+        data = self._bitmap.to_bytes((self._size + 7) // 8, "little")
+        picked = {}
+        while len(picked) < amount:
+            i = random.randrange(self._size)
+            if data[i >> 3] >> (i & 7) & 1:
+                picked[i] = None
+        return list(picked)
+
+
+class TokenIndex:
+    """
+    An inverted index mapping normalized tokens to the catalog indices of their entries.
+
+    Entries must be added in increasing index order, which keeps the posting lists sorted.
+    Once frozen, tokens common enough for a bitmap to be smaller than their posting list
+    are stored as bitmaps, so intersecting them is a single big integer AND.
+    """
+
+    __slots__ = ("_bitmaps", "_postings", "_size")
+
+    def __init__(
+        self,
+        postings: Optional[dict[str, array]] = None,
+        bitmaps: Optional[dict[str, int]] = None,
+        size: int = 0,
+    ) -> None:
+        self._postings: dict[str, array] = postings or {}
+        self._bitmaps: dict[str, int] = bitmaps or {}
+        self._size = size
+
+    def __len__(self) -> int:
+        return len(self._postings) + len(self._bitmaps)
+
+    def add(self, index: int, tokens: Iterable[str]) -> None:
+        for token in set(tokens):
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = array("I")
+            postings.append(index)
+
+    def freeze(self, size: int, tokens: Optional[Iterable[str]] = None) -> None:
+        """
+        Convert the posting lists of common tokens to bitmaps, ``size`` being the entry count.
+
+        Only ``tokens`` are considered if they're given.
+        """
+        self._size = size
+        # A posting costs 4 bytes, a bitmap costs 1 bit per entry
+        threshold = size // 32
+        for token in list(self._postings if tokens is None else tokens):
+            postings = self._postings.get(token)
+            if postings is not None and len(postings) > threshold:
+                self._bitmaps[token] = to_bitmap(postings, size)
+                del self._postings[token]
+
+    def extended(self, other: TokenIndex, offset: int, size: int) -> TokenIndex:
+        """
+        Returns a copy of this index with the entries of an unfrozen ``other`` added.
+
+        Their indices are shifted by ``offset``, and ``size`` is the new entry count.
+        Only the posting lists and bitmaps of the tokens ``other`` has are copied.
+        """
+        postings = self._postings.copy()
+        bitmaps = self._bitmaps.copy()
+        for token, found in other._postings.items():
+            shifted = array("I", (i + offset for i in found))
+            if token in bitmaps:
+                bitmaps[token] |= to_bitmap(shifted, size)
+            elif token in postings:
+                postings[token] = postings[token] + shifted
+            else:
+                postings[token] = shifted
+        index = type(self)(postings, bitmaps)
+        index.freeze(size, other._postings)
+        return index
+
+    def search(self, query: str, allowed: int) -> SearchResult:
+        """Returns the entries matching every token of ``query`` and set in ``allowed``."""
+        return self.lookup(tokenize(query), allowed)
+
+    def lookup(self, tokens: Iterable[str], allowed: Optional[int] = None) -> SearchResult:
+        """Returns the entries with every one of ``tokens``, and set in ``allowed`` if given."""
+        tokens = set(tokens)
+        if not tokens:
+            return SearchResult(self._size)
+        bitmap = allowed
+        sparse: list[array] = []
+        for token in tokens:
+            if token in self._bitmaps:
+                found = self._bitmaps[token]
+                bitmap = found if bitmap is None else bitmap & found
+            elif token in self._postings:
+                sparse.append(self._postings[token])
+            else:
+                return SearchResult(self._size)
+        if not sparse:
+            return SearchResult(self._size, bitmap=bitmap)
+
+        # Check each entry of the rarest token against the bitmap and the other postings
+        sparse.sort(key=len)
+        data = bitmap.to_bytes((self._size + 7) // 8, "little") if bitmap is not None else None
+        matches = []
+        for index in sparse[0]:
+            if data is not None and not data[index >> 3] >> (index & 7) & 1:
+                continue
+            for other in sparse[1:]:
+                position = bisect_left(other, index)
+                if position == len(other) or other[position] != index:
+                    break
+            else:
+                matches.append(index)
+        return SearchResult(self._size, indices=matches)
+
+    def to_bytes(self) -> bytes:
+        tokens = list(self._postings)
+        dense = list(self._bitmaps)
+        length = (self._size + 7) // 8
+        header = {
+            "size": self._size,
+            "tokens": tokens,
+            "lengths": [len(self._postings[token]) for token in tokens],
+            "bitmaps": dense,
+        }
+        header = json.dumps(header).encode()
+        return b"".join(
+            (
+                _HEADER_LENGTH.pack(len(header)),
+                header,
+                *(self._postings[token].tobytes() for token in tokens),
+                *(self._bitmaps[token].to_bytes(length, "little") for token in dense),
+            )
+        )
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, memoryview], *, swap: bool = False) -> TokenIndex:
+        view = memoryview(data)
+        (length,) = _HEADER_LENGTH.unpack_from(view, 0)
+        pos = _HEADER_LENGTH.size
+        header = json.loads(bytes(view[pos : pos + length]))
+        pos += length
+        postings = {}
+        for token, count in zip(header["tokens"], header["lengths"]):
+            found = array("I")
+            size = count * found.itemsize
+            found.frombytes(view[pos : pos + size])
+            if swap:
+                found.byteswap()
+            postings[token] = found
+            pos += size
+        bitmaps = {}
+        size = (header["size"] + 7) // 8
+        for token in header["bitmaps"]:
+            bitmaps[token] = int.from_bytes(view[pos : pos + size], "little")
+            pos += size
+        return cls(postings, bitmaps, header["size"])
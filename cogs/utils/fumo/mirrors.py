@@ -0,0 +1,119 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Awaitable, Callable, Iterable, Optional, TypeVar
+
+__all__ = ("MirrorSelector",)
+
+T = TypeVar("T")
+# Fetches from a mirror, calling the callback once the mirror has responded
+Fetch = Callable[[str, Callable[[], None]], Awaitable[T]]
+
+
+class MirrorSelector:
+    """
+    Picks which catalog mirror to fetch from, fastest first.
+
+    The latency of each mirror is tracked as an exponentially weighted moving average.
+    A fetch that hasn't got a response after about twice its mirror's usual latency is
+    hedged to the next mirror, and whichever finishes first with a valid response wins.
+
+    Latency is measured until the response headers arrive rather than until the body
+    is read, so a small delta or a 304 and a whole catalog download are comparable.
+    """
+
+    def __init__(
+        self,
+        *,
+        alpha: float = 0.3,
+        hedge_delay: float = 5.0,
+        min_hedge_delay: float = 0.5,
+        failure_penalty: float = 30.0,
+    ) -> None:
+        self.alpha = alpha
+        # Used until a mirror has been measured
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.failure_penalty = failure_penalty
+        self.latencies: dict[str, float] = {}
+
+    def record(self, url: str, seconds: float) -> None:
+        """Fold a measured latency into the mirror's average."""
+        latency = self.latencies.get(url)
+        if latency is None:
+            self.latencies[url] = seconds
+        else:
+            self.latencies[url] = latency + self.alpha * (seconds - latency)
+
+    def failed(self, url: str) -> None:
+        """Count a failed fetch as a very slow one, so the mirror is tried later next time."""
+        self.record(url, self.failure_penalty)
+
+    def ordered(self, urls: Iterable[str]) -> list[str]:
+        """Returns the mirrors fastest first, unmeasured ones are kept in the configured order."""
+        return sorted(urls, key=lambda url: self.latencies.get(url, self.hedge_delay))
+
+    def delay(self, url: str) -> float:
+        """Returns how long to wait on ``url`` before hedging to the next mirror."""
+        latency = self.latencies.get(url)
+        if latency is None:
+            return self.hedge_delay
+        return max(self.min_hedge_delay, 2 * latency)
+
+    async def _timed(self, url: str, fetch: Fetch[T], responded: asyncio.Event) -> T:
+        start = time.perf_counter()
+
+        def respond() -> None:
+            if not responded.is_set():
+                self.record(url, time.perf_counter() - start)
+                responded.set()
+
+        try:
+            result = await fetch(url, respond)
+        except asyncio.CancelledError:
+            # Lost the race before responding, it took at least this long
+            respond()
+            raise
+        except Exception:
+            self.failed(url)
+            raise
+        # In case ``fetch`` didn't say when it got a response
+        respond()
+        return result
+
+    async def fetch(self, urls: Iterable[str], fetch: Fetch[T]) -> T:
+        """
+        Call ``fetch`` with the mirrors in order, hedging slow ones, and return the first result.
+
+        ``fetch`` is called with a mirror and a callback to call once the mirror has
+        responded, i.e. when the response headers arrive. The other fetches in flight
+        are cancelled. If every mirror fails, the last exception is raised.
+        """
+        queue = self.ordered(urls)
+        if not queue:
+            raise ValueError("No mirrors to fetch from.")
+        pending: dict[asyncio.Task[T], asyncio.Event] = {}
+        error: Optional[BaseException] = None
+        try:
+            while queue or pending:
+                timeout = None
+                # A mirror that responded isn't hedged, however long its body takes
+                if queue and not any(responded.is_set() for responded in pending.values()):
+                    url = queue.pop(0)
+                    responded = asyncio.Event()
+                    pending[asyncio.create_task(self._timed(url, fetch, responded))] = responded
+                    timeout = self.delay(url)
+                done, _ = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    del pending[task]
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                # Nothing succeeded yet, either it's slow or it failed so try the next mirror
+        finally:
+            for task in pending:
+                task.cancel()
+        raise error
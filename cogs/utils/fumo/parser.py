@@ -0,0 +1,206 @@
+from __future__ import annotations
+
+import json
+import re
+from typing import Any, Callable
+
+__all__ = ("CatalogParser",)
+
+_WHITESPACE = re.compile(rb"[ \t\r\n]*")
+_STRUCTURAL = re.compile(rb'["\[\]{}]')
+_SCALAR_END = re.compile(rb"[,\]}\s]")
+# A string item without escapes followed by a comma, the common case
+_SIMPLE_ITEM = re.compile(rb'"([^"\\]*)"[ \t\r\n]*,[ \t\r\n]*')
+
+# Parser states
+(
+    _START,
+    _FIRST_KEY,
+    _KEY,
+    _COLON,
+    _VALUE,
+    _AFTER_VALUE,
+    _FIRST_ITEM,
+    _ITEM,
+    _AFTER_ITEM,
+    _DONE,
+) = range(10)
+
+
+class CatalogParser:
+    """
+    An incremental parser for catalog documents.
+
+    A catalog document is a JSON object whose values are either arrays of items
+    or scalars. Chunks can be fed as they arrive, so the full document never has
+    to be held in memory.
+
+    String items are handed to ``on_item`` as raw UTF-8 bytes without being decoded,
+    any other item (e.g. an object with metadata) is handed over decoded.
+    Top-level values that aren't arrays are handed to ``on_value`` decoded.
+    """
+
+    def __init__(
+        self,
+        on_item: Callable[[str, bytes | Any], None],
+        on_value: Callable[[str, Any], None] | None = None,
+    ) -> None:
+        self.on_item = on_item
+        self.on_value = on_value
+        self._buffer = bytearray()
+        self._state = _START
+        self._key: str | None = None
+
+    def feed(self, chunk: bytes) -> None:
+        """Feed the next chunk of the document."""
+        if self._state == _DONE:
+            if chunk.strip():
+                raise ValueError("Unexpected data after the end of the catalog.")
+            return
+        self._buffer += chunk
+        consumed = self._parse()
+        del self._buffer[:consumed]
+        if self._state == _DONE and self._buffer.strip():
+            raise ValueError("Unexpected data after the end of the catalog.")
+
+    def close(self) -> None:
+        """Finish parsing, raises `ValueError` if the document is incomplete."""
+        if self._state != _DONE:
+            raise ValueError("The catalog ended unexpectedly.")
+
+    def _skip_whitespace(self, pos: int) -> int:
+        return _WHITESPACE.match(self._buffer, pos).end()
+
+    def _string_end(self, pos: int) -> int:
+        """Returns the index past the closing quote of the string at ``pos``, -1 if incomplete."""
+        buffer = self._buffer
+        end = pos + 1
+        while True:
+            end = buffer.find(b'"', end)
+            if end == -1:
+                return -1
+            backslashes = 0
+            while buffer[end - 1 - backslashes] == 0x5C:  # \
+                backslashes += 1
+            if not backslashes % 2:
+                return end + 1
+            end += 1
+
+    def _value_end(self, pos: int) -> int:
+        """Returns the index past the JSON value at ``pos``, -1 if incomplete."""
+        buffer = self._buffer
+        first = buffer[pos]
+        if first == 0x22:  # "
+            return self._string_end(pos)
+        if first not in (0x5B, 0x7B):  # [ {
+            match = _SCALAR_END.search(buffer, pos)
+            return match.start() if match else -1
+        depth = 0
+        end = pos
+        while True:
+            match = _STRUCTURAL.search(buffer, end)
+            if not match:
+                return -1
+            char = buffer[match.start()]
+            if char == 0x22:
+                end = self._string_end(match.start())
+                if end == -1:
+                    return -1
+                continue
+            end = match.end()
+            depth += 1 if char in (0x5B, 0x7B) else -1
+            if not depth:
+                return end
+
+    def _expect(self, pos: int, char: bytes) -> None:
+        if self._buffer[pos : pos + 1] != char:
+            found = bytes(self._buffer[pos : pos + 1])
+            raise ValueError(f"Expected {char!r} in the catalog, found {found!r}.")
+
+    def _parse(self) -> int:
+        buffer = self._buffer
+        pos = 0
+        while True:
+            pos = self._skip_whitespace(pos)
+            if pos >= len(buffer):
+                return pos
+            state = self._state
+
+            if state == _START:
+                self._expect(pos, b"{")
+                self._state = _FIRST_KEY
+                pos += 1
+
+            elif state == _FIRST_KEY and buffer[pos] == 0x7D:  # }
+                self._state = _DONE
+                return pos + 1
+
+            elif state in (_FIRST_KEY, _KEY):
+                self._expect(pos, b'"')
+                end = self._string_end(pos)
+                if end == -1:
+                    return pos
+                self._key = json.loads(buffer[pos:end])
+                self._state = _COLON
+                pos = end
+
+            elif state == _COLON:
+                self._expect(pos, b":")
+                self._state = _VALUE
+                pos += 1
+
+            elif state == _VALUE:
+                if buffer[pos] == 0x5B:  # [
+                    self._state = _FIRST_ITEM
+                    pos += 1
+                    continue
+                end = self._value_end(pos)
+                if end == -1:
+                    return pos
+                if self.on_value:
+                    self.on_value(self._key, json.loads(buffer[pos:end]))
+                self._state = _AFTER_VALUE
+                pos = end
+
+            elif state == _AFTER_VALUE:
+                if buffer[pos] == 0x7D:  # }
+                    self._state = _DONE
+                    return pos + 1
+                self._expect(pos, b",")
+                self._state = _KEY
+                pos += 1
+
+            elif state == _FIRST_ITEM and buffer[pos] == 0x5D:  # ]
+                self._state = _AFTER_VALUE
+                pos += 1
+
+            elif state in (_FIRST_ITEM, _ITEM):
+                key, on_item, match = self._key, self.on_item, _SIMPLE_ITEM.match
+                while item := match(buffer, pos):
+                    on_item(key, item.group(1))
+                    pos = item.end()
+                    self._state = _ITEM
+                if pos >= len(buffer):
+                    return pos
+                end = self._value_end(pos)
+                if end == -1:
+                    return pos
+                if buffer[pos] == 0x22 and buffer.find(b"\\", pos, end) == -1:
+                    # The fast path, no escapes to decode
+                    self.on_item(self._key, bytes(buffer[pos + 1 : end - 1]))
+                else:
+                    item = json.loads(buffer[pos:end])
+                    self.on_item(self._key, item.encode() if isinstance(item, str) else item)
+                self._state = _AFTER_ITEM
+                pos = end
+
+            elif state == _AFTER_ITEM:
+                if buffer[pos] == 0x5D:  # ]
+                    self._state = _AFTER_VALUE
+                else:
+                    self._expect(pos, b",")
+                    self._state = _ITEM
+                pos += 1
+
+            else:
+                raise ValueError("Unexpected data after the end of the catalog.")
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import random
+from collections import OrderedDict
+from typing import Hashable
+
+__all__ = ("ShuffleBag", "ShuffleBagSampler", "permute")
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(value: int) -> int:
+    # SplitMix64 finalizer
+    value = (value ^ (value >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+    value = (value ^ (value >> 27)) * 0x94D049BB133111EB & _MASK64
+    return value ^ (value >> 31)
+
+
+def permute(index: int, size: int, seed: int, *, rounds: int = 4) -> int:
+    """
+    Returns the position of ``index`` in a pseudo-random permutation of ``range(size)``.
+
+    The permutation is fully described by ``seed``, so it never has to be materialized.
+    This uses a balanced Feistel network with cycle-walking to stay within ``size``.
+    """
+    if size <= 1:
+        return 0
+    bits = (size - 1).bit_length()
+    bits += bits & 1
+    half = bits // 2
+    mask = (1 << half) - 1
+    while True:
+        left, right = index >> half, index & mask
+        for r in range(rounds):
+            left, right = right, left ^ (_mix(right ^ seed ^ (r << 56)) & mask)
+        index = (left << half) | right
+        if index < size:
+            return index
+
+
+class ShuffleBag:
+    """A lazily shuffled bag, stored as a seed and a cursor instead of a copied list."""
+
+    __slots__ = ("seed", "cursor", "size")
+
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self.reset()
+
+    def reset(self) -> None:
+        self.seed = random.getrandbits(64)
+        self.cursor = 0
+
+    def draw(self) -> int:
+        """Returns the next index, reshuffling once the bag is exhausted."""
+        if self.cursor >= self.size:
+            self.reset()
+        index = permute(self.cursor, self.size, self.seed)
+        self.cursor += 1
+        return index
+
+
+class ShuffleBagSampler:
+    """
+    Non-repeating sampling with one shuffle bag per key (e.g. per channel).
+
+    Bags are evicted in least recently used order once there are more than
+    ``max_bags`` of them, so memory stays bounded no matter how many keys are seen.
+    """
+
+    def __init__(self, max_bags: int = 50_000) -> None:
+        self.max_bags = max_bags
+        self._bags: OrderedDict[Hashable, ShuffleBag] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._bags)
+
+    def draw(self, key: Hashable, size: int) -> int:
+        """
+        Draw an index in ``range(size)`` from the bag for ``key``.
+
+        If the pool size changed since the bag was made (e.g. the catalog was refreshed),
+        only that bag is reshuffled, on its next draw.
+        """
+        bag = self._bags.get(key)
+        if bag is None:
+            bag = self._bags[key] = ShuffleBag(size)
+            if len(self._bags) > self.max_bags:
+                self._bags.popitem(last=False)
+        else:
+            self._bags.move_to_end(key)
+            if bag.size != size:
+                bag.size = size
+                bag.reset()
+        return bag.draw()
+
+    def clear(self) -> None:
+        self._bags.clear()
@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from redis.asyncio import Redis
+
+__all__ = ("CatalogSnapshot",)
+
+SNAPSHOT_KEY = "fumo:catalog"
+DELTAS_KEY = "fumo:catalog:deltas"
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    """
+    The last good copy of the Fumo catalog, persisted in Redis.
+
+    Attributes
+    ----------
+    data: :class:`bytes`
+        The compiled catalog, see :meth:`FumoCatalog.to_bytes`.
+    etag: Optional[:class:`str`]
+        The ``ETag`` header the catalog was served with.
+    last_modified: Optional[:class:`str`]
+        The ``Last-Modified`` header the catalog was served with.
+    deltas: Tuple[:class:`bytes`, ...]
+        The delta documents applied to the catalog since, in order.
+    epoch: Optional[:class:`str`]
+        The epoch of the favourites numbered for the catalog, see :class:`Favourites`.
+        Saved along with the catalog, so the two always match.
+    """
+
+    data: bytes
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    deltas: tuple[bytes, ...] = ()
+    epoch: Optional[str] = None
+
+    @property
+    def headers(self) -> dict[str, str]:
+        """The conditional request headers to revalidate this snapshot with."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+    @classmethod
+    async def load(cls, redis: Redis) -> Optional[CatalogSnapshot]:
+        """Load the snapshot from Redis, returns `None` if there's none."""
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(SNAPSHOT_KEY)
+            pipe.lrange(DELTAS_KEY, 0, -1)
+            raw, deltas = await pipe.execute()
+        if not raw.get(b"data"):
+            return None
+        etag = raw.get(b"etag")
+        last_modified = raw.get(b"last_modified")
+        epoch = raw.get(b"epoch")
+        return cls(
+            data=raw[b"data"],
+            etag=etag.decode() if etag else None,
+            last_modified=last_modified.decode() if last_modified else None,
+            deltas=tuple(deltas),
+            epoch=epoch.decode() if epoch else None,
+        )
+
+    async def save(self, redis: Redis) -> None:
+        """Replace the snapshot stored in Redis with this one."""
+        mapping = {"data": self.data}
+        if self.etag:
+            mapping["etag"] = self.etag
+        if self.last_modified:
+            mapping["last_modified"] = self.last_modified
+        if self.epoch:
+            mapping["epoch"] = self.epoch
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.delete(SNAPSHOT_KEY, DELTAS_KEY)
+            pipe.hset(SNAPSHOT_KEY, mapping=mapping)
+            if self.deltas:
+                pipe.rpush(DELTAS_KEY, *self.deltas)
+            await pipe.execute()
+
+    async def append(self, redis: Redis, delta: bytes) -> CatalogSnapshot:
+        """
+        Append a delta document to the snapshot stored in Redis, returns the updated snapshot.
+
+        Only the delta is written. The revalidation headers are dropped,
+        they were for the catalog before it.
+        """
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hdel(SNAPSHOT_KEY, "etag", "last_modified")
+            pipe.rpush(DELTAS_KEY, delta)
+            await pipe.execute()
+        return replace(self, etag=None, last_modified=None, deltas=(*self.deltas, delta))
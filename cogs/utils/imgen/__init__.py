@@ -1,2 +1,10 @@
+from .assets import *
+from .avatars import *
 from .buttons import *
+from .cache import *
+from .compositing import *
 from .converters import *
+from .encoding import *
+from .render import *
+from .scheduler import *
+from .templates import *
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+from pathlib import Path
+from types import MappingProxyType
+from typing import Iterator, Mapping
+
+from PIL import Image
+
+from .templates import AVATAR, TEMPLATES, Template
+
+__all__ = ("AssetRegistry",)
+
+ASSETS_PATH = Path(__file__).parent
+
+
+class AssetRegistry(Mapping[str, Image.Image]):
+    """
+    The layers of the Imgen templates, decoded and converted to RGBA once.
+
+    The images are shared by every render, so they must only ever be read from,
+    e.g. pasted or used as a mask, and never drawn on or closed.
+    """
+
+    def __init__(self, images: Mapping[str, Image.Image]) -> None:
+        self._images = MappingProxyType(dict(images))
+
+    @classmethod
+    def load(
+        cls, templates: Mapping[str, Template] = TEMPLATES, directory: Path = ASSETS_PATH
+    ) -> AssetRegistry:
+        """
+        Load and validate the layers, this does disk I/O so run it in an executor.
+
+        Layers are cropped to their template's canvas, the part past it is never drawn.
+        Raises `ValueError` if a layer is smaller than the canvas.
+        """
+        images = {}
+        for template in templates.values():
+            width, height = template.size
+            for name in template.layers:
+                if name == AVATAR:
+                    continue
+                if name not in images:
+                    with Image.open(directory / f"{name}.png") as image:
+                        if image.width < width or image.height < height:
+                            raise ValueError(
+                                f"Layer {name!r} is {image.size}, smaller than {template.size}."
+                            )
+                        # Decoded now, so renders in other threads never trigger a lazy load
+                        images[name] = image.convert("RGBA").crop((0, 0, width, height))
+                elif images[name].size != template.size:
+                    raise ValueError(f"Layer {name!r} is shared by templates of other sizes.")
+        return cls(images)
+
+    def __getitem__(self, name: str) -> Image.Image:
+        return self._images[name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._images)
+
+    def __len__(self) -> int:
+        return len(self._images)
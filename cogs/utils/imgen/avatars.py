@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import asyncio
+from collections import OrderedDict
+
+import discord
+
+__all__ = ("AvatarCache",)
+
+
+class AvatarCache:
+    """
+    Downloaded avatars in an LRU bounded by their size in bytes.
+
+    Avatars are keyed by their asset hash, so a changed avatar is a different key and
+    never served stale. Concurrent requests for one avatar share a single download.
+    """
+
+    def __init__(self, max_size: int = 32 * 1024 * 1024) -> None:
+        self.max_size = max_size
+        self._avatars: OrderedDict[str, bytes] = OrderedDict()
+        self._size = 0
+        self._pending: dict[str, asyncio.Task[bytes]] = {}
+        self.hits = 0
+        self.misses = 0
+        # Requests that joined a download already in flight
+        self.shared = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._avatars)
+
+    @property
+    def size(self) -> int:
+        """The bytes used by the cached avatars."""
+        return self._size
+
+    async def get(self, asset: discord.Asset) -> bytes:
+        """Returns the avatar's bytes, downloading it if it isn't cached."""
+        key = asset.key
+        data = self._avatars.get(key)
+        if data is not None:
+            self._avatars.move_to_end(key)
+            self.hits += 1
+            return data
+        task = self._pending.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._pending[key] = asyncio.create_task(self._download(key, asset))
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        else:
+            self.shared += 1
+        # Shielded so one cancelled command doesn't fail everyone waiting on the download
+        return await asyncio.shield(task)
+
+    async def _download(self, key: str, asset: discord.Asset) -> bytes:
+        data = await asset.read()
+        if len(data) <= self.max_size:
+            self._avatars[key] = data
+            self._size += len(data)
+            while self._size > self.max_size:
+                _, evicted = self._avatars.popitem(last=False)
+                self._size -= len(evicted)
+                self.evictions += 1
+        return data
+
+    def clear(self) -> None:
+        self._avatars.clear()
+        self._size = 0
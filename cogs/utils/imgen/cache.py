@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+import hashlib
+from pathlib import Path
+from typing import Mapping
+
+from core.utils.cache import TieredCache
+
+from .assets import ASSETS_PATH
+from .templates import AVATAR, RENDER_VERSION, TEMPLATES, Template
+
+__all__ = ("RenderCache",)
+
+
+def template_digest(template: Template, directory: Path = ASSETS_PATH) -> str:
+    """A digest of everything a template's renders depend on but the avatar and the profile."""
+    digest = hashlib.sha256(f"{RENDER_VERSION}\0{template!r}\0".encode())
+    for name in template.layers:
+        if name != AVATAR:
+            digest.update((directory / f"{name}.png").read_bytes())
+    return digest.hexdigest()
+
+
+class RenderCache(TieredCache):
+    """
+    Rendered images by content, in a memory LRU backed by a disk LRU.
+
+    Renders are deterministic, so the key is a hash of everything that goes into one,
+    see `RenderCache.key`. It covers the template and its assets, so renders of a changed
+    template are never served, they're evicted over time or with `clear`.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        templates: Mapping[str, Template] = TEMPLATES,
+        assets: Path = ASSETS_PATH,
+        max_memory: int = 32 * 1024 * 1024,
+        max_disk: int = 512 * 1024 * 1024,
+    ) -> None:
+        super().__init__(directory, max_memory=max_memory, max_disk=max_disk)
+        # Read once, the assets are only a few files
+        self._digests = {
+            name: template_digest(template, assets) for name, template in templates.items()
+        }
+
+    def key(self, template: str, avatar: bytes, profile: str) -> str:
+        """The key of a render of ``template`` with an avatar, encoded with ``profile``."""
+        digest = hashlib.sha256(f"{self._digests[template]}\0{profile}\0".encode())
+        digest.update(avatar)
+        return digest.hexdigest()
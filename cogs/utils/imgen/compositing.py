@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import sys
+import threading
+from typing import Literal, Mapping, Sequence
+
+from PIL import Image
+
+from .templates import AVATAR, RenderPlan
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+__all__ = ("NUMPY_AVAILABLE", "Compositor", "VectorizedPlan")
+
+# Pixels are handled as 32 bit integers, which assumes a little-endian machine
+NUMPY_AVAILABLE = np is not None and sys.byteorder == "little"
+
+Compositor = Literal["pillow", "numpy"]
+
+
+def _div255(values: np.ndarray) -> np.ndarray:
+    """Divide by 255 in place, rounded the way Pillow does when it pastes with a mask."""
+    values += 128
+    values += values >> 8
+    values >>= 8
+    return values
+
+
+class VectorizedPlan:
+    """
+    A render plan's layers as NumPy arrays, composited exactly like `Image.paste` does.
+
+    Everything that doesn't depend on the avatar is done once: the layers are composited
+    without it, and the pixels where it shows, i.e. in its box and not under an opaque
+    layer, are found. A render then only blends those pixels, with the layers above the
+    avatar kept premultiplied by their alpha. Several avatars can be composited at once.
+
+    Buffers are preallocated per thread and reused, so the returned canvases are only
+    valid until the thread composites again.
+    """
+
+    def __init__(
+        self, plan: RenderPlan, assets: Mapping[str, Image.Image], max_batch: int = 8
+    ) -> None:
+        if np is None:
+            raise RuntimeError("NumPy is needed for the numpy compositor.")
+        if sys.byteorder != "little":
+            raise RuntimeError("The numpy compositor only works on little-endian machines.")
+        self.size = plan.size
+        self.max_batch = max_batch
+        width, height = plan.size
+        left, top, right, bottom = plan.box
+        position = plan.layers.index(AVATAR)
+        below = Image.new("RGBA", plan.size, None)
+        for name in plan.layers[:position]:
+            below.paste(assets[name], (0, 0), assets[name])
+        static = below.copy()
+        above = []
+        hidden = np.zeros((height, width), bool)
+        for name in plan.layers[position + 1 :]:
+            static.paste(assets[name], (0, 0), assets[name])
+            layer = np.asarray(assets[name])
+            hidden |= layer[..., 3] == 255
+            above.append(layer.reshape(-1, 4))
+
+        visible = np.zeros((height, width), bool)
+        visible[top:bottom, left:right] = True
+        visible &= ~hidden
+        # Flat pixel indices of where the avatar shows, on the canvas and in its box
+        self._index = np.flatnonzero(visible)
+        rows, columns = np.divmod(self._index, width)
+        self._box_index = (rows - top) * (right - left) + (columns - left)
+        self._base = np.asarray(static)
+        self._below = np.asarray(below).reshape(-1, 4)[self._index].astype(np.uint16)
+        self._transparent_below = not self._below.any()
+        self._layers = []
+        for layer in above:
+            pixels = layer[self._index]
+            # Blending with a transparent pixel changes nothing, so only these are blended
+            partial = np.flatnonzero(pixels[:, 3] != 0)
+            pixels = pixels[partial].astype(np.uint16)
+            alpha = pixels[:, 3:].copy()
+            self._layers.append((partial, pixels * alpha, 255 - alpha))
+        self._local = threading.local()
+
+    @property
+    def visible(self) -> int:
+        """How many pixels of the canvas the avatar can show on."""
+        return len(self._index)
+
+    def _buffers(self) -> tuple[np.ndarray, np.ndarray]:
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None:
+            width, height = self.size
+            pixels = len(self._index)
+            buffers = self._local.buffers = (
+                np.empty((self.max_batch, height * width), np.uint32),
+                np.empty((self.max_batch, pixels), np.uint32),
+            )
+        return buffers
+
+    def composite(self, avatars: Sequence[Image.Image]) -> np.ndarray:
+        """
+        Composite avatars placed by `place_avatar`, at most ``max_batch`` of them.
+
+        Returns their canvases stacked, as RGBA arrays.
+        """
+        amount = len(avatars)
+        canvases, pixels = (buffer[:amount] for buffer in self._buffers())
+        # Pixels are moved around whole, as 32 bit integers, and blended by channel
+        canvases[...] = self._base.view(np.uint32).reshape(-1)
+        for position, avatar in enumerate(avatars):
+            flat = np.asarray(avatar).view(np.uint32).reshape(-1)
+            np.take(flat, self._box_index, out=pixels[position])
+        channels = pixels.view(np.uint8).reshape(amount, -1, 4)
+
+        # Pasting the avatar
+        if self._transparent_below:
+            # Over nothing, opaque pixels are kept and clear ones cleared, so only the
+            # translucent ones are blended. Alpha is the most significant byte
+            clear = pixels <= 0x00FFFFFF
+            translucent = pixels <= 0xFEFFFFFF
+            translucent &= ~clear
+            np.putmask(pixels, clear, 0)
+            where = np.nonzero(translucent)
+            values = channels[where].astype(np.uint16)
+            values *= values[:, 3:].copy()
+            channels[where] = _div255(values)
+        else:
+            values = channels.astype(np.uint16)
+            alpha = values[..., 3:].copy()
+            values *= alpha
+            values += self._below * (255 - alpha)
+            channels[...] = _div255(values)
+        # Then each layer above it
+        for partial, premultiplied, inverse in self._layers:
+            values = channels[:, partial].astype(np.uint16)
+            values *= inverse
+            values += premultiplied
+            channels[:, partial] = _div255(values)
+
+        canvases[:, self._index] = pixels
+        return canvases.view(np.uint8).reshape(amount, self.size[1], self.size[0], 4)
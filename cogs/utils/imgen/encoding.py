@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from io import BytesIO
+from types import MappingProxyType
+from typing import Any, Literal, Mapping, NamedTuple
+
+from PIL import Image
+
+__all__ = ("PROFILES", "EncodingProfile", "ProfileName", "encode")
+
+ProfileName = Literal["fast", "webp"]
+
+
+class EncodingProfile(NamedTuple):
+    """How a render is encoded, the arguments of `Image.save` and the file extension."""
+
+    format: str
+    extension: str
+    options: Mapping[str, Any]
+
+
+# Run `python -m benchmarks.imgen_encoding` for how they compare on the templates
+PROFILES: Mapping[str, EncodingProfile] = MappingProxyType(
+    {
+        # A few times faster than Pillow's default level 6, for slightly bigger files
+        "fast": EncodingProfile("PNG", "png", MappingProxyType({"compress_level": 1})),
+        # Lossless and a third to a half smaller than PNG. Quality is the effort when lossless.
+        # Smaller and faster than PNG's higher compression levels on every template
+        "webp": EncodingProfile(
+            "WEBP", "webp", MappingProxyType({"lossless": True, "quality": 0})
+        ),
+    }
+)
+
+
+def encode(image: Image.Image, profile: str = "fast") -> bytes:
+    """Encode and close ``image`` with the profile named ``profile``."""
+    format, _, options = PROFILES[profile]
+    fp = BytesIO()
+    image.save(fp, format, **options)
+    image.close()
+    return fp.getvalue()
@@ -0,0 +1,331 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import multiprocessing
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from types import MappingProxyType
+from typing import Literal, Mapping, MutableSequence, Optional, Sequence, Union
+
+from PIL import Image
+
+from .assets import AssetRegistry
+from .compositing import Compositor, VectorizedPlan
+from .encoding import encode
+from .templates import AVATAR, TEMPLATES, RenderPlan, compile_template
+
+__all__ = ("Renderer", "render", "render_many")
+
+Backend = Literal["process", "thread"]
+
+# The layers and compiled templates of this process, loaded once by init_worker
+_assets: Optional[AssetRegistry] = None
+_plans: Mapping[str, RenderPlan] = MappingProxyType({})
+# Built on first use by the numpy compositor
+_vectorized: dict[str, VectorizedPlan] = {}
+# The cancellation flags shared with the renderer, one per avatar a job can have
+_cancelled: MutableSequence[int] = []
+# The most avatars composited at once
+MAX_BATCH = 8
+
+
+def init_worker(flags: Optional[MutableSequence[int]] = None) -> None:
+    """Load the templates in this process, the initializer of the render workers."""
+    global _assets, _cancelled, _plans
+    if flags is not None:
+        _cancelled = flags
+    if _assets is None:
+        _plans = MappingProxyType(
+            {name: compile_template(template) for name, template in TEMPLATES.items()}
+        )
+        _assets = AssetRegistry.load()
+
+
+def warm(compositor: Compositor = "pillow") -> int:
+    """A no-op task that makes sure a worker is started and initialized."""
+    init_worker()
+    if compositor == "numpy":
+        for template in _plans:
+            _vectorize(template)
+    return os.getpid()
+
+
+def _vectorize(template: str) -> VectorizedPlan:
+    plan = _vectorized.get(template)
+    if plan is None:
+        plan = _vectorized[template] = VectorizedPlan(_plans[template], _assets, MAX_BATCH)
+    return plan
+
+
+def place_avatar(data: bytes, plan: RenderPlan) -> Image.Image:
+    """
+    The avatar resized, rotated and cropped to the plan's box.
+
+    Unrotated avatars take a single resampling pass, rotated ones are resized and then
+    rotated straight into the box, without an expanded rotation to crop.
+    """
+    with Image.open(BytesIO(data)) as image:
+        avatar = image.convert("RGBA")
+    left, top, right, bottom = plan.box
+    size = (right - left, bottom - top)
+    if not plan.rotated:
+        sx, sy = avatar.width / plan.avatar_size, avatar.height / plan.avatar_size
+        a, _, c, _, e, f = plan.matrix
+        # Resizing the source box straight to the box, Pillow's resize is separable and
+        # antialiased so it beats a generic transform
+        source = (c * sx, f * sy, (a * size[0] + c) * sx, (e * size[1] + f) * sy)
+        placed = avatar.resize(size, Image.Resampling.LANCZOS, box=source)
+        avatar.close()
+        return placed
+    # Transforms don't antialias, so the avatar is resized with an antialiased filter first,
+    # box reduced before that but never below its size. It's then rotated straight into the
+    # box with nearest neighbour, like the old expanded rotation, so renders stay the same
+    resized = avatar.resize(
+        (plan.avatar_size, plan.avatar_size), Image.Resampling.LANCZOS, reducing_gap=3.0
+    )
+    avatar.close()
+    placed = resized.transform(size, Image.Transform.AFFINE, plan.matrix, Image.Resampling.NEAREST)
+    resized.close()
+    return placed
+
+
+def render(
+    template: str, avatar: bytes, profile: str = "fast", compositor: Compositor = "pillow"
+) -> bytes:
+    """
+    Render ``template`` with an avatar, encoded with ``profile``.
+
+    Module level so it can be pickled.
+    """
+    result = render_many(template, [avatar], profile, compositor)[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def render_many(
+    template: str,
+    avatars: Sequence[bytes],
+    profile: str = "fast",
+    compositor: Compositor = "pillow",
+    flags: Optional[int] = None,
+) -> list[Union[bytes, Exception, None]]:
+    """
+    Render ``template`` with each avatar, the numpy compositor composites them at once.
+
+    Returns the renders in order, or the exception an avatar failed with,
+    so one bad avatar doesn't fail the others.
+
+    ``flags`` is where the avatars' flags start in the cancellation flags. They're
+    checked between placing, compositing and encoding, and a cancelled avatar's
+    render is stopped there and returned as `None`.
+    """
+    init_worker()
+    plan = _plans[template]
+
+    def cancelled(position: int) -> bool:
+        return flags is not None and bool(_cancelled[flags + position])
+
+    results: list[Union[bytes, Exception, None]] = [None] * len(avatars)
+    placed: dict[int, Image.Image] = {}
+    for position, avatar in enumerate(avatars):
+        if cancelled(position):
+            continue
+        try:
+            placed[position] = place_avatar(avatar, plan)
+        except (Image.DecompressionBombError, OSError, ValueError) as error:
+            results[position] = error
+    for position in [position for position in placed if cancelled(position)]:
+        placed.pop(position).close()
+
+    if compositor == "numpy":
+        vectorized = _vectorize(template)
+        positions = list(placed)
+        for start in range(0, len(positions), MAX_BATCH):
+            batch = positions[start : start + MAX_BATCH]
+            canvases = vectorized.composite([placed[position] for position in batch])
+            # Encoded right away, the canvases are reused by the next batch
+            for position, canvas in zip(batch, canvases):
+                if not cancelled(position):
+                    results[position] = encode(Image.fromarray(canvas), profile)
+    else:
+        for position, avatar in placed.items():
+            if cancelled(position):
+                continue
+            image = Image.new("RGBA", plan.size, None)
+            for layer in plan.layers:
+                if layer == AVATAR:
+                    image.paste(avatar, plan.box[:2], avatar)
+                else:
+                    mask = _assets[layer]
+                    image.paste(mask, (0, 0), mask)
+            results[position] = encode(image, profile)
+    for avatar in placed.values():
+        avatar.close()
+    return results
+
+
+class _Job:
+    """Renders submitted together, and the slot of their cancellation flags."""
+
+    __slots__ = ("futures", "slot", "finished")
+
+    def __init__(self, futures: list[asyncio.Future[bytes]], slot: int) -> None:
+        self.futures = futures
+        self.slot = slot
+        self.finished = False
+
+
+class Renderer:
+    """
+    Runs Imgen renders, bytes in and bytes out.
+
+    The ``process`` backend renders in a dedicated process pool, one worker per core
+    by default, so throughput scales with cores instead of being held by the GIL.
+    The ``thread`` backend uses the event loop's default thread pool.
+    Workers are spawned rather than forked, the bot process has threads running.
+
+    At most one job per worker is submitted at a time. Renders of the same template
+    that queue up meanwhile are sent as one job, up to ``max_batch`` of them, which
+    the ``numpy`` compositor composites at once.
+
+    Cancelling a render, e.g. when it times out, really stops it: a waiting render is
+    never submitted, and a running one is flagged in memory shared with the workers,
+    which check it between the stages of a render and skip what's left.
+
+    If a worker dies, e.g. killed for its memory, the renders running in the pool fail
+    and the pool is replaced, so later renders don't.
+    """
+
+    def __init__(
+        self,
+        backend: Backend = "process",
+        workers: Optional[int] = None,
+        compositor: Compositor = "pillow",
+        max_batch: int = MAX_BATCH,
+    ) -> None:
+        self.backend = backend
+        self.workers = workers or os.cpu_count() or 1
+        self.compositor = compositor
+        self.max_batch = max_batch
+        self._executor: Optional[Executor] = None
+        # A slot of max_batch flags per job that can run at once, set when a render is cancelled
+        self._flags = multiprocessing.get_context("spawn").RawArray("b", self.workers * max_batch)
+        self._slots = list(range(self.workers))
+        # (template, profile) -> the avatars waiting and their futures, oldest first
+        self._waiting: dict[tuple[str, str], list[tuple[bytes, asyncio.Future[bytes]]]] = {}
+        self._running = 0
+
+    async def start(self) -> None:
+        """Start the workers and load the templates in each of them."""
+        loop = asyncio.get_running_loop()
+        if self.backend == "thread":
+            await loop.run_in_executor(None, init_worker, self._flags)
+            await loop.run_in_executor(None, warm, self.compositor)
+            return
+        self._executor = self._make_executor()
+        # A worker is only spawned when none is idle, so submit one task per worker at once
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self._executor, warm, self.compositor)
+                for _ in range(self.workers)
+            )
+        )
+
+    def _make_executor(self) -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(self._flags,),
+        )
+
+    def _replace(self, broken: Optional[Executor]) -> Optional[Executor]:
+        """Replace the process pool if it's still ``broken``, returns the current one."""
+        if broken is not None and broken is self._executor:
+            broken.shutdown(wait=False, cancel_futures=True)
+            self._executor = self._make_executor()
+        return self._executor
+
+    async def render(self, template: str, avatar: bytes, profile: str = "fast") -> bytes:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault((template, profile), []).append((avatar, future))
+        self._submit()
+        return await future
+
+    def _submit(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._running < self.workers and self._waiting:
+            key = next(iter(self._waiting))
+            waiting = self._waiting.pop(key)
+            # Dropping the renders nobody waits for anymore
+            waiting = [(avatar, future) for avatar, future in waiting if not future.done()]
+            jobs, rest = waiting[: self.max_batch], waiting[self.max_batch :]
+            if rest:
+                self._waiting[key] = rest
+            if not jobs:
+                continue
+            self._running += 1
+            job = _Job([future for _, future in jobs], self._slots.pop())
+            start = job.slot * self.max_batch
+            self._flags[start : start + len(jobs)] = bytes(len(jobs))
+            for position, future in enumerate(job.futures):
+                future.add_done_callback(functools.partial(self._cancel, job, start + position))
+            template, profile = key
+            call = functools.partial(
+                render_many,
+                template,
+                [avatar for avatar, _ in jobs],
+                profile,
+                self.compositor,
+                start,
+            )
+            executor = self._executor
+            try:
+                task = loop.run_in_executor(executor, call)
+            except BrokenProcessPool:
+                # A worker died while the pool was idle
+                executor = self._replace(executor)
+                task = loop.run_in_executor(executor, call)
+            task.add_done_callback(functools.partial(self._done, job, executor))
+
+    def _cancel(self, job: _Job, flag: int, future: asyncio.Future[bytes]) -> None:
+        # The slot could be another job's by now
+        if future.cancelled() and not job.finished:
+            self._flags[flag] = 1
+
+    def _done(self, job: _Job, executor: Optional[Executor], task: asyncio.Future) -> None:
+        job.finished = True
+        self._slots.append(job.slot)
+        self._running -= 1
+        futures = job.futures
+        if task.cancelled():
+            for future in futures:
+                future.cancel()
+            results = []
+        elif task.exception() is not None:
+            if isinstance(task.exception(), BrokenProcessPool):
+                self._replace(executor)
+            results = [task.exception()] * len(futures)
+        else:
+            results = task.result()
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+        self._submit()
+
+    def shutdown(self) -> None:
+        for waiting in self._waiting.values():
+            for _, future in waiting:
+                future.cancel()
+        self._waiting.clear()
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
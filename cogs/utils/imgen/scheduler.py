@@ -0,0 +1,146 @@
+from __future__ import annotations
+
+import asyncio
+import math
+import time
+from collections import OrderedDict, deque
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+__all__ = ("QueueFull", "RenderScheduler")
+
+T = TypeVar("T")
+
+
+class QueueFull(Exception):
+    """Raised when a render is rejected, ``retry_after`` is the estimated wait in seconds."""
+
+    def __init__(self, retry_after: float) -> None:
+        self.retry_after = retry_after
+        super().__init__(f"The render queue is full, try again in {retry_after:.1f} seconds.")
+
+
+class RenderScheduler:
+    """
+    Admission control and fair queuing for renders.
+
+    At most ``concurrency`` renders run at once. The others wait in a queue per user
+    and are started round-robin across users, so one user's burst can't starve the
+    others. Renders are rejected right away with `QueueFull` when the queue, or the
+    user's share of it, is full, or when the estimated wait is over ``max_wait``.
+    """
+
+    def __init__(
+        self,
+        concurrency: int,
+        *,
+        max_queue: int = 32,
+        max_per_user: int = 2,
+        max_wait: float = 30.0,
+        alpha: float = 0.2,
+    ) -> None:
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.max_wait = max_wait
+        self.alpha = alpha
+        # User -> their waiting renders, in the order users are served
+        self._queues: OrderedDict[Hashable, deque[asyncio.Future[None]]] = OrderedDict()
+        self._depth = 0
+        self._running = 0
+        # EWMA of how long a render runs, in seconds, until one is measured it's a guess
+        self.duration = 1.0
+        # Seconds renders waited in the queue, the most recent ones
+        self.waits: deque[float] = deque(maxlen=256)
+        self.completed = 0
+        self.rejected = 0
+        self.peak_depth = 0
+
+    @property
+    def depth(self) -> int:
+        """How many renders are waiting."""
+        return self._depth
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def estimate(self, position: int) -> float:
+        """The estimated wait of a render with ``position`` renders ahead of it, in seconds."""
+        if position < self.concurrency - self._running:
+            return 0.0
+        rounds = math.ceil((position + self._running + 1) / self.concurrency) - 1
+        return rounds * self.duration
+
+    def wait_percentile(self, percentile: float) -> float:
+        """A percentile of the recent queue waits, in seconds."""
+        if not self.waits:
+            return 0.0
+        waits = sorted(self.waits)
+        return waits[min(len(waits) - 1, int(len(waits) * percentile))]
+
+    async def run(self, user: Hashable, render: Callable[[], Awaitable[T]]) -> T:
+        """
+        Run ``render()`` once there's room for it.
+
+        Raises `QueueFull` if it's rejected.
+        """
+        queued = time.perf_counter()
+        if self._running < self.concurrency and not self._depth:
+            self._running += 1
+        else:
+            await self._enqueue(user)
+        self.waits.append(time.perf_counter() - queued)
+
+        started = time.perf_counter()
+        try:
+            result = await render()
+        finally:
+            self._release()
+        duration = time.perf_counter() - started
+        self.duration += self.alpha * (duration - self.duration)
+        self.completed += 1
+        return result
+
+    async def _enqueue(self, user: Hashable) -> None:
+        queue = self._queues.get(user)
+        estimate = self.estimate(self._depth)
+        if (
+            self._depth >= self.max_queue
+            or (queue is not None and len(queue) >= self.max_per_user)
+            or estimate > self.max_wait
+        ):
+            self.rejected += 1
+            raise QueueFull(max(estimate, self.duration))
+        future = asyncio.get_running_loop().create_future()
+        if queue is None:
+            queue = self._queues[user] = deque()
+        queue.append(future)
+        self._depth += 1
+        self.peak_depth = max(self.peak_depth, self._depth)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Started right as it was cancelled, give its slot to the next one
+                self._release()
+            elif future in queue:
+                queue.remove(future)
+                self._depth -= 1
+                if not queue and self._queues.get(user) is queue:
+                    del self._queues[user]
+            raise
+
+    def _release(self) -> None:
+        self._running -= 1
+        while self._running < self.concurrency and self._queues:
+            user, queue = next(iter(self._queues.items()))
+            future = queue.popleft()
+            # To the back of the line, whether they have more renders waiting or not
+            del self._queues[user]
+            if queue:
+                self._queues[user] = queue
+            self._depth -= 1
+            if future.done():
+                continue
+            self._running += 1
+            future.set_result(None)
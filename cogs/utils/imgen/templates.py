@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import math
+from types import MappingProxyType
+from typing import Mapping, NamedTuple
+
+from .encoding import ProfileName
+
+__all__ = (
+    "AVATAR",
+    "RENDER_VERSION",
+    "TEMPLATES",
+    "RenderPlan",
+    "Template",
+    "compile_template",
+)
+
+# The layer the avatar is drawn at, the other layers are template assets
+AVATAR = "avatar"
+# Bump when a change to the rendering code changes how renders look, cached ones are keyed by it
+RENDER_VERSION = 1
+
+
+class Template(NamedTuple):
+    """
+    An Imgen template, described as data.
+
+    The avatar is resized to an ``avatar_size`` square, rotated counterclockwise by
+    ``rotation`` degrees and pasted at ``offset``. The layers are drawn bottom to top
+    on a transparent canvas of ``size``, each one other than `AVATAR` is the asset
+    file of that name, drawn at the top left and at least as big as the canvas.
+    """
+
+    size: tuple[int, int]
+    avatar_size: int
+    offset: tuple[int, int] = (0, 0)
+    rotation: float = 0.0
+    layers: tuple[str, ...] = (AVATAR,)
+    profile: ProfileName = "fast"
+
+
+# Credits to dj_tomato on Discord for the templates
+TEMPLATES: Mapping[str, Template] = MappingProxyType(
+    {
+        "marisahat": Template((262, 262), 262, layers=(AVATAR, "marisahat")),
+        "polaroid": Template(
+            (451, 600), 260, offset=(120, 200), rotation=315, layers=(AVATAR, "polaroid")
+        ),
+        "selfie": Template((433, 577), 577, offset=(-33, 0), layers=(AVATAR, "selfie")),
+    }
+)
+
+
+class RenderPlan(NamedTuple):
+    """A `Template` compiled for rendering, everything that doesn't depend on the avatar."""
+
+    size: tuple[int, int]
+    avatar_size: int
+    # The part of the canvas the avatar covers
+    box: tuple[int, int, int, int]
+    # The affine matrix mapping the box to the resized avatar, so rotating and placing it
+    # is a single resampling pass
+    matrix: tuple[float, float, float, float, float, float]
+    layers: tuple[str, ...]
+
+    @property
+    def rotated(self) -> bool:
+        return bool(self.matrix[1] or self.matrix[3])
+
+
+Matrix = tuple[float, float, float, float, float, float]
+
+
+def _rotation(size: int, angle: float) -> tuple[tuple[int, int], Matrix]:
+    """The expanded size and inverse matrix of rotating a square, as `Image.rotate` does."""
+    angle %= 360.0
+    if angle == 0:
+        return (size, size), (1.0, 0.0, 0.0, 0.0, 1.0, 0.0)
+    center = size / 2
+    radians = -math.radians(angle)
+    a, b = round(math.cos(radians), 15), round(math.sin(radians), 15)
+    d, e = -b, a
+
+    def transform(x: float, y: float, c: float = 0.0, f: float = 0.0) -> tuple[float, float]:
+        return a * x + b * y + c, d * x + e * y + f
+
+    c, f = transform(-center, -center)
+    c, f = c + center, f + center
+    corners = [transform(x, y, c, f) for x, y in ((0, 0), (size, 0), (size, size), (0, size))]
+    xs, ys = zip(*corners)
+    width = math.ceil(max(xs)) - math.floor(min(xs))
+    height = math.ceil(max(ys)) - math.floor(min(ys))
+    c, f = transform(-(width - size) / 2, -(height - size) / 2, c, f)
+    return (width, height), (a, b, c, d, e, f)
+
+
+def compile_template(template: Template) -> RenderPlan:
+    """
+    Compile a template into the plan its renders follow.
+
+    Raises `ValueError` if the template isn't valid.
+    """
+    if template.layers.count(AVATAR) != 1:
+        raise ValueError(f"A template must have exactly one {AVATAR!r} layer.")
+    (width, height), (a, b, c, d, e, f) = _rotation(template.avatar_size, template.rotation)
+    # Only the part of the avatar that lands on the canvas is resampled
+    x, y = template.offset
+    left, top = max(x, 0), max(y, 0)
+    right, bottom = min(x + width, template.size[0]), min(y + height, template.size[1])
+    if left >= right or top >= bottom:
+        raise ValueError("The avatar must be on the canvas.")
+    # Moved to the box's corner, i.e. box coordinates are canvas ones minus the corner
+    x, y = left - x, top - y
+    matrix = (a, b, a * x + b * y + c, d, e, d * x + e * y + f)
+    return RenderPlan(
+        template.size, template.avatar_size, (left, top, right, bottom), matrix, template.layers
+    )
@@ -3,6 +3,7 @@ from __future__ import annotations
 import json
 from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Literal, Optional
 
 import discord
 
@@ -20,6 +21,18 @@ class Config:
         The bot's description.
     embed_colour: :class:`discord.Colour`
         The bot's embed colour.
+    fumo_mirrors: List[:class:`str`]
+        The URLs the Fumo catalog is fetched from, the fastest one is preferred.
+    fumo_refresh_interval: :class:`float`
+        How often the Fumo catalog is refreshed, in minutes.
+    imgen_backend: :class:`str`
+        Where Imgen renders run, either ``process`` for a dedicated process pool
+        or ``thread`` for the default thread pool.
+    imgen_compositor: :class:`str`
+        How Imgen templates are composited, either ``pillow`` or ``numpy``,
+        which composites some templates faster and needs NumPy installed.
+    imgen_workers: Optional[:class:`int`]
+        The number of render processes, defaults to the number of cores.
     mobile: :class:`bool`
         Whether to use mobile status.
     permissions: :class:`discord.Permissions`
@@ -39,6 +52,13 @@ class Config:
     prefix: str
     redis_uri: str
     token: str
+    fumo_refresh_interval: float = 60.0
+    fumo_mirrors: list[str] = field(
+        default_factory=lambda: ["https://kuro-rui.github.io/api/fumo/all.json"]
+    )
+    imgen_backend: Literal["process", "thread"] = "process"
+    imgen_compositor: Literal["pillow", "numpy"] = "pillow"
+    imgen_workers: Optional[int] = None
 
     @classmethod
     def from_json(cls) -> Config:
@@ -60,6 +80,11 @@ class Config:
         return {
             "description": self.description,
             "embed_colour": self.embed_colour,
+            "fumo_mirrors": self.fumo_mirrors,
+            "fumo_refresh_interval": self.fumo_refresh_interval,
+            "imgen_backend": self.imgen_backend,
+            "imgen_compositor": self.imgen_compositor,
+            "imgen_workers": self.imgen_workers,
             "mobile": self.mobile,
             "permissions": self.permissions,
             "prefix": self.prefix,
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import asyncio
+import os
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+__all__ = ("TieredCache",)
+
+
+class TieredCache:
+    """
+    Bytes by key, in a memory LRU backed by a disk LRU.
+
+    Both tiers are bounded by their size in bytes. Keys are used as file names,
+    followed by ``suffix``, and the disk tier survives restarts. Disk I/O happens
+    in the default executor so the event loop isn't blocked.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        *,
+        max_memory: int = 32 * 1024 * 1024,
+        max_disk: int = 256 * 1024 * 1024,
+        suffix: str = "",
+    ) -> None:
+        self.directory = directory
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.suffix = suffix
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        # Key -> size on disk, least recently used first, loaded on first use
+        self._disk: Optional[OrderedDict[str, int]] = None
+        self._disk_size = 0
+        self._disk_lock = asyncio.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}{self.suffix}"
+
+    def _scan(self) -> OrderedDict[str, int]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        files = sorted(
+            (
+                path
+                for path in self.directory.iterdir()
+                if path.is_file() and path.name.endswith(self.suffix)
+            ),
+            key=lambda path: path.stat().st_mtime,
+        )
+        suffix = len(self.suffix)
+        return OrderedDict(
+            (path.name[: len(path.name) - suffix], path.stat().st_size) for path in files
+        )
+
+    def _read(self, path: Path) -> Optional[bytes]:
+        try:
+            data = path.read_bytes()
+            # Refresh its place for the next scan
+            os.utime(path)
+        except OSError:
+            return None
+        return data
+
+    def _write(self, path: Path, data: bytes, evicted: list[str]) -> None:
+        path.write_bytes(data)
+        self._delete(evicted)
+
+    def _delete(self, keys: list[str]) -> None:
+        for key in keys:
+            self._path(key).unlink(missing_ok=True)
+
+    def _remember(self, key: str, data: bytes) -> None:
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_size -= len(previous)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.max_memory:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    async def _load_disk(self) -> OrderedDict[str, int]:
+        async with self._disk_lock:
+            if self._disk is None:
+                loop = asyncio.get_running_loop()
+                self._disk = await loop.run_in_executor(None, self._scan)
+                self._disk_size = sum(self._disk.values())
+        return self._disk
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Returns the cached data, `None` if there's none."""
+        data = self._memory.get(key)
+        if data is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+            return data
+        disk = await self._load_disk()
+        if key in disk:
+            loop = asyncio.get_running_loop()
+            data = await loop.run_in_executor(None, self._read, self._path(key))
+            if data is not None:
+                disk.move_to_end(key)
+                self._remember(key, data)
+                self.disk_hits += 1
+                return data
+            self._disk_size -= disk.pop(key, 0)
+        self.misses += 1
+        return None
+
+    async def put(self, key: str, data: bytes) -> None:
+        """Cache data in memory and on disk."""
+        self._remember(key, data)
+        disk = await self._load_disk()
+        previous = disk.pop(key, 0)
+        disk[key] = len(data)
+        self._disk_size += len(data) - previous
+        evicted = []
+        while self._disk_size > self.max_disk and len(disk) > 1:
+            name, size = disk.popitem(last=False)
+            self._disk_size -= size
+            evicted.append(name)
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self._write, self._path(key), data, evicted)
+        except OSError:
+            # Still cached in memory, the disk tier is best effort
+            self._disk_size -= disk.pop(key, 0)
+
+    async def clear(self) -> None:
+        """Remove everything, from memory and from disk."""
+        self._memory.clear()
+        self._memory_size = 0
+        disk = await self._load_disk()
+        keys = list(disk)
+        disk.clear()
+        self._disk_size = 0
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._delete, keys)
+
+    @property
+    def memory_size(self) -> int:
+        return self._memory_size
+
+    @property
+    def disk_size(self) -> int:
+        return self._disk_size
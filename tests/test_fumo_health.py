@@ -0,0 +1,95 @@
+"""
+Link checks against a local server.
+
+Run from the repository root with ``python -m unittest discover tests``.
+"""
+
+from __future__ import annotations
+
+import socket
+import unittest
+
+import aiohttp
+from aiohttp import web
+
+from cogs.utils.fumo.health import LinkChecker
+
+
+async def image(request: web.Request) -> web.Response:
+    return web.Response(body=b"\x89PNG", content_type="image/png")
+
+
+async def no_head(request: web.Request) -> web.Response:
+    if request.method == "HEAD":
+        return web.Response(status=405)
+    return web.Response(status=206, body=b"\x89", content_type="image/png")
+
+
+async def landing_page(request: web.Request) -> web.Response:
+    return web.Response(text="<html></html>", content_type="text/html")
+
+
+def unused_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class LinkCheckerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self) -> None:
+        app = web.Application()
+        app.router.add_route("*", "/image.png", image)
+        app.router.add_route("*", "/no-head.png", no_head)
+        app.router.add_route("*", "/landing.png", landing_page)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        self.base = f"http://127.0.0.1:{self.runner.addresses[0][1]}"
+        self.session = aiohttp.ClientSession()
+        self.checker = LinkChecker(self.session, timeout=5.0)
+
+    async def asyncTearDown(self) -> None:
+        await self.session.close()
+        await self.runner.cleanup()
+
+    async def test_ok(self) -> None:
+        status = await self.checker.check(f"{self.base}/image.png")
+        self.assertEqual(status.status, 200)
+        self.assertEqual(status.content_type, "image/png")
+        self.assertEqual(status.size, 4)
+        self.assertTrue(status.healthy)
+
+    async def test_gone(self) -> None:
+        status = await self.checker.check(f"{self.base}/missing.png")
+        self.assertEqual(status.status, 404)
+        self.assertTrue(status.gone)
+        self.assertFalse(status.healthy)
+
+    async def test_head_not_allowed(self) -> None:
+        status = await self.checker.check(f"{self.base}/no-head.png")
+        self.assertEqual(status.status, 206)
+        self.assertTrue(status.healthy)
+
+    async def test_refused(self) -> None:
+        status = await self.checker.check(f"http://127.0.0.1:{unused_port()}/image.png")
+        self.assertIsNone(status.status)
+        self.assertFalse(status.gone)
+        self.assertFalse(status.healthy)
+
+    async def test_landing_page(self) -> None:
+        status = await self.checker.check(f"{self.base}/landing.png")
+        self.assertEqual(status.status, 200)
+        self.assertTrue(status.suspicious)
+        self.assertFalse(status.healthy)
+        self.assertFalse(status.gone)
+
+    async def test_check_all(self) -> None:
+        urls = [f"{self.base}/{name}" for name in ("image.png", "missing.png", "landing.png")]
+        checked, failing = await self.checker.check_all([*urls, urls[0]])
+        self.assertEqual(checked, 3)
+        self.assertEqual(set(failing), set(urls[1:]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+"""
+Pixel parity of the NumPy compositor with Pillow.
+
+Run from the repository root with ``python -m unittest discover tests``.
+"""
+
+from __future__ import annotations
+
+import unittest
+from io import BytesIO
+
+from PIL import Image
+
+from cogs.utils.imgen.compositing import NUMPY_AVAILABLE
+from cogs.utils.imgen.render import MAX_BATCH, render_many
+from cogs.utils.imgen.templates import TEMPLATES
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def encode(image: Image.Image) -> bytes:
+    fp = BytesIO()
+    image.save(fp, "PNG")
+    return fp.getvalue()
+
+
+def make_avatars() -> dict[str, bytes]:
+    rng = np.random.default_rng(0)
+    noise = rng.integers(0, 256, (512, 512, 4), np.uint8)
+    # Every alpha value, fully clear and fully opaque ones included
+    noise[..., 3] = np.arange(512 * 512).reshape(512, 512) % 256
+    opaque = Image.fromarray(noise[..., :3])
+    translucent = Image.fromarray(noise)
+    return {
+        "opaque": encode(opaque),
+        "translucent": encode(translucent),
+        "non-square": encode(translucent.crop((0, 0, 300, 200))),
+        "tiny": encode(translucent.resize((7, 7))),
+        "palette": encode(opaque.convert("P", palette=Image.Palette.ADAPTIVE)),
+        "broken": b"\x89PNG\r\n\x1a\nnot really a PNG",
+    }
+
+
+@unittest.skipUnless(NUMPY_AVAILABLE, "the numpy compositor isn't available")
+class CompositorParityTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.avatars = make_avatars()
+
+    def assertSameRenders(self, template: str, avatars: list[bytes]) -> None:
+        expected = render_many(template, avatars, "fast", "pillow")
+        rendered = render_many(template, avatars, "fast", "numpy")
+        self.assertEqual(len(expected), len(rendered))
+        for before, after in zip(expected, rendered):
+            if isinstance(before, Exception):
+                self.assertIsInstance(after, type(before))
+            else:
+                self.assertEqual(before, after)
+
+    def test_each_avatar(self) -> None:
+        for template in TEMPLATES:
+            for name, avatar in self.avatars.items():
+                with self.subTest(template=template, avatar=name):
+                    self.assertSameRenders(template, [avatar])
+
+    def test_batches(self) -> None:
+        # More than a batch, broken avatars in the middle of it
+        avatars = [*self.avatars.values()] * (MAX_BATCH // len(self.avatars) + 2)
+        for template in TEMPLATES:
+            with self.subTest(template=template):
+                self.assertSameRenders(template, avatars)
+
+    def test_broken_avatar(self) -> None:
+        for template in TEMPLATES:
+            with self.subTest(template=template):
+                (result,) = render_many(template, [self.avatars["broken"]], "fast", "numpy")
+                self.assertIsInstance(result, Exception)
+
+
+if __name__ == "__main__":
+    unittest.main()